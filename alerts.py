@@ -1,39 +1,82 @@
 #!/usr/bin/env python3
-from typing import List, Optional
+from typing import Dict, Optional, Set, Tuple
 from fastapi import WebSocket, WebSocketDisconnect
 import asyncio
+import threading
+import orjson
+
+# Pending messages per client before it is considered too slow and dropped
+CLIENT_QUEUE_SIZE = 32
 
 class AlertManager:
     def __init__(self):
-        self.connections: List[WebSocket] = []
+        # Outgoing queue and writer task per connected client
+        self.connections: Dict[WebSocket, Tuple[asyncio.Queue, asyncio.Task]] = {}
+        # Fire-and-forget tasks; the loop only keeps weak references to them
+        self._tasks: Set[asyncio.Task] = set()
+
+    def _spawn(self, coro) -> asyncio.Task:
+        """Start a background task and hold a reference until it finishes"""
+        task = asyncio.get_running_loop().create_task(coro)
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        return task
 
     async def connect(self, websocket: WebSocket):
         await websocket.accept()
-        self.connections.append(websocket)
+        queue = asyncio.Queue(maxsize=CLIENT_QUEUE_SIZE)
+        task = asyncio.create_task(self._writer(websocket, queue))
+        self.connections[websocket] = (queue, task)
+
+    async def _writer(self, websocket: WebSocket, queue: asyncio.Queue):
+        """Drain one client's queue so a slow peer only delays itself"""
+        try:
+            while True:
+                payload = await queue.get()
+                await websocket.send_text(payload)
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            self.disconnect(websocket)
 
     def disconnect(self, websocket: WebSocket):
-        if websocket in self.connections:
-            self.connections.remove(websocket)
+        entry = self.connections.pop(websocket, None)
+        if entry is not None:
+            entry[1].cancel()
+
+    async def _drop(self, websocket: WebSocket):
+        """Disconnect a client that fell behind; it will reconnect and resync"""
+        self.disconnect(websocket)
+        try:
+            await websocket.close(code=1013)
+        except Exception:
+            pass
 
     async def broadcast(self, message: dict):
-        stale = []
-        for ws in list(self.connections):
+        # Serialize once and hand the payload to each client's writer task.
+        # Sent as a text frame since browser clients JSON.parse() the data.
+        payload = orjson.dumps(message).decode()
+        to_drop = []
+        for ws, (queue, _) in tuple(self.connections.items()):
             try:
-                await ws.send_json(message)
-            except Exception:
-                stale.append(ws)
-        for ws in stale:
-            self.disconnect(ws)
+                queue.put_nowait(payload)
+            except asyncio.QueueFull:
+                to_drop.append(ws)
+        for ws in to_drop:
+            self._spawn(self._drop(ws))
 
 # Singleton instance to import across modules
 alert_manager = AlertManager()
 
 # Store reference to the main asyncio event loop used by FastAPI/Uvicorn
 _event_loop: Optional[asyncio.AbstractEventLoop] = None
+_loop_thread_id: Optional[int] = None
 
 def set_event_loop(loop: asyncio.AbstractEventLoop):
-    global _event_loop
+    """Register the server loop; must be called from the loop's own thread"""
+    global _event_loop, _loop_thread_id
     _event_loop = loop
+    _loop_thread_id = threading.get_ident()
 
 def broadcast_from_thread(message: dict):
     """Schedule a broadcast safely from non-async contexts/threads.
@@ -41,6 +84,10 @@ def broadcast_from_thread(message: dict):
     """
     if _event_loop and _event_loop.is_running():
         try:
-            asyncio.run_coroutine_threadsafe(alert_manager.broadcast(message), _event_loop)
+            if threading.get_ident() == _loop_thread_id:
+                # Already on the loop thread: skip the cross-thread wakeup
+                alert_manager._spawn(alert_manager.broadcast(message))
+            else:
+                asyncio.run_coroutine_threadsafe(alert_manager.broadcast(message), _event_loop)
         except Exception:
             pass
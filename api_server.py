@@ -4,22 +4,26 @@ FastAPI Backend Server for Cigarette Detection System
 Includes image detection, parental control, and app protection features
 """
 
-from fastapi import FastAPI, File, UploadFile, HTTPException, BackgroundTasks, Form, WebSocket, WebSocketDisconnect
+from fastapi import FastAPI, File, UploadFile, HTTPException, Form, WebSocket, Request
 from contextlib import asynccontextmanager
-from fastapi.responses import JSONResponse, FileResponse
+from fastapi.responses import ORJSONResponse, FileResponse, Response
 from fastapi.staticfiles import StaticFiles
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.middleware.gzip import GZipMiddleware
 from pydantic import BaseModel
 from typing import List, Optional, Dict, Any
 import asyncio
 import json
 import uuid
 import os
-import shutil
+import hashlib
 from datetime import datetime
 import sqlite3
 import threading
 import time
+from concurrent.futures import ThreadPoolExecutor
+import aiofiles
+import msgpack
 
 # Import our detection logic
 from main import SmokingVapingDetector
@@ -47,13 +51,36 @@ async def lifespan(app: FastAPI):
     except RuntimeError:
         loop = asyncio.get_running_loop()
     set_event_loop(loop)
+    
+    # Read the static frontends once instead of opening them per request
+    _load_static_assets()
+    
+    # Detection runs in worker threads so inference never blocks the loop
+    asyncio.get_running_loop().set_default_executor(
+        ThreadPoolExecutor(max_workers=os.cpu_count())
+    )
+    
+    # Open the shared jobs database connections
+    global writer, reader_pool
+    writer = WriterConn()
+    reader_pool = ReaderPool(READER_POOL_SIZE)
+    
+    # Long-lived workers drain the bounded batch job queue
+    global job_queue
+    job_queue = asyncio.Queue(maxsize=JOB_QUEUE_SIZE)
+    workers = [asyncio.create_task(_job_worker()) for _ in range(JOB_WORKERS)]
     yield
+    for worker in workers:
+        worker.cancel()
+    reader_pool.close()
+    writer.close()
 
 app = FastAPI(
     title="Vaping and Smoking Detection System",
     description="AI-powered detection of smoking in images and videos, including vaping devices and cigarettes.",
     version="1.0.0",
     lifespan=lifespan,
+    default_response_class=ORJSONResponse,
 )
 
 # Configure CORS
@@ -65,6 +92,9 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Compress larger JSON bodies for clients that accept gzip
+app.add_middleware(GZipMiddleware, minimum_size=1024)
+
 # Include self-monitoring router
 app.include_router(self_monitoring_router)
 
@@ -92,10 +122,11 @@ async def alerts_ws(websocket: WebSocket):
     await alert_manager.connect(websocket)
     try:
         print("[WS] client connected")
-        while True:
-            # Keep the connection alive; we don't expect client messages
-            await websocket.receive_text()
-    except WebSocketDisconnect:
+        # We don't expect client messages; just wait for the close. Liveness
+        # is handled by protocol-level ping/pong configured on the server.
+        while (await websocket.receive())["type"] != "websocket.disconnect":
+            pass
+    finally:
         alert_manager.disconnect(websocket)
         print("[WS] client disconnected")
 
@@ -117,25 +148,65 @@ async def send_test_alert(kind: str = "smoking", confidence: float = 0.87):
     return {"status": "ok", "message": message}
 
 # Serve static files and web frontend
+STATIC_ASSETS = {
+    "web_frontend.html": "text/html",
+    "simple_frontend.html": "text/html",
+    "manifest.json": "application/json",
+}
+_static_cache: Dict[str, tuple] = {}
+
+def _load_static_assets():
+    """Cache frontend files in memory as (body, media_type, etag)"""
+    for filename, media_type in STATIC_ASSETS.items():
+        try:
+            with open(filename, "rb") as f:
+                body = f.read()
+        except OSError:
+            continue
+        etag = f'"{hashlib.sha1(body).hexdigest()}"'
+        _static_cache[filename] = (body, media_type, etag)
+
+def _static_response(filename: str, request: Request):
+    """Serve a cached asset, answering 304 when the client's copy is current"""
+    asset = _static_cache.get(filename)
+    if asset is None:
+        # Not cached (e.g. missing at startup); fall back to reading from disk
+        return FileResponse(filename)
+    
+    body, media_type, etag = asset
+    headers = {"ETag": etag, "Cache-Control": "public, max-age=60"}
+    if request.headers.get("if-none-match") == etag:
+        return Response(status_code=304, headers=headers)
+    return Response(body, media_type=media_type, headers=headers)
+
 @app.get("/")
-async def serve_frontend():
-    return FileResponse("web_frontend.html")
+async def serve_frontend(request: Request):
+    return _static_response("web_frontend.html", request)
 
 @app.get("/simple")
-async def serve_simple_frontend():
-    return FileResponse("simple_frontend.html")
+async def serve_simple_frontend(request: Request):
+    return _static_response("simple_frontend.html", request)
 
 @app.get("/manifest.json")
-async def serve_manifest():
-    return FileResponse("manifest.json")
+async def serve_manifest(request: Request):
+    return _static_response("manifest.json", request)
 
 # Global instances
 detector = SmokingVapingDetector()
 protection_system = AppProtectionSystem()
 
 # Job management
+JOB_QUEUE_SIZE = 64  # pending batch jobs before submissions get a 503
+JOB_WORKERS = 2
+
 jobs_db = "jobs.db"
-active_jobs = {}
+READER_POOL_SIZE = 4
+STATEMENT_CACHE_SIZE = 512  # prepared statements kept per persistent connection
+WRITE_RETRIES = 5  # attempts for BEGIN/COMMIT on "database is locked"
+RESULTS_BATCH_SIZE = 16  # images per job_results transaction
+INFERENCE_BATCH_SIZE = 8  # images per batched forward pass
+UPLOAD_CHUNK_SIZE = 1 << 16
+UPLOAD_CONCURRENCY = 8  # concurrent temp-file writes per batch upload
 
 # Pydantic models
 class DetectionResult(BaseModel):
@@ -156,11 +227,39 @@ class BatchJobResults(BaseModel):
     summary: Dict[str, Any]
 
 # Database initialization
+def _connect(read_only=False):
+    """Open a jobs database connection with tuned per-connection PRAGMAs.
+
+    Connections run in autocommit mode; writers open their own transaction
+    with BEGIN IMMEDIATE so the write lock is taken up front.
+    """
+    if read_only:
+        # Pooled readers are handed to one coroutine at a time but may run
+        # their queries on a worker thread, so allow cross-thread use
+        conn = sqlite3.connect(
+            f"file:{jobs_db}?mode=ro", uri=True, isolation_level=None,
+            cached_statements=STATEMENT_CACHE_SIZE, check_same_thread=False,
+        )
+        conn.row_factory = sqlite3.Row
+    else:
+        conn = sqlite3.connect(
+            jobs_db, isolation_level=None, cached_statements=STATEMENT_CACHE_SIZE
+        )
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.execute("PRAGMA busy_timeout=5000")
+    conn.execute("PRAGMA cache_size=-20000")
+    conn.execute("PRAGMA temp_store=MEMORY")
+    conn.execute("PRAGMA foreign_keys=ON")
+    return conn
+
 def init_jobs_db():
     """Initialize jobs database"""
-    conn = sqlite3.connect(jobs_db)
+    conn = _connect()
     cursor = conn.cursor()
     
+    # WAL is persistent in the database file, so it only needs setting once
+    cursor.execute("PRAGMA journal_mode=WAL")
+    
     cursor.execute('''
         CREATE TABLE IF NOT EXISTS batch_jobs (
             id TEXT PRIMARY KEY,
@@ -180,17 +279,128 @@ def init_jobs_db():
             filename TEXT,
             cigarette_detected BOOLEAN,
             max_confidence REAL,
-            detection_details TEXT,
+            detection_details BLOB,
             FOREIGN KEY (job_id) REFERENCES batch_jobs (id)
         )
     ''')
     
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_job_results_job_id
+        ON job_results (job_id)
+    ''')
+    
     conn.commit()
     conn.close()
 
+class WriterConn:
+    """Single shared writer connection, serialized with an asyncio.Lock"""
+    
+    def __init__(self):
+        self.conn = _connect()
+        self.lock = asyncio.Lock()
+    
+    async def _execute_with_retry(self, sql):
+        """Run BEGIN/COMMIT, backing off and retrying while the database is locked"""
+        for attempt in range(WRITE_RETRIES):
+            try:
+                self.conn.execute(sql)
+                return
+            except sqlite3.OperationalError as e:
+                if "locked" not in str(e) or attempt == WRITE_RETRIES - 1:
+                    raise
+                await asyncio.sleep(0.05 * 2 ** attempt)
+    
+    @asynccontextmanager
+    async def transaction(self):
+        """Hold the writer lock for one BEGIN IMMEDIATE ... COMMIT block.
+        
+        BEGIN IMMEDIATE takes the write lock before the body runs, so only
+        the BEGIN and the COMMIT can hit SQLITE_BUSY; both are retried.
+        """
+        async with self.lock:
+            await self._execute_with_retry("BEGIN IMMEDIATE")
+            try:
+                yield self.conn.cursor()
+                await self._execute_with_retry("COMMIT")
+            except BaseException:
+                if self.conn.in_transaction:
+                    self.conn.rollback()
+                raise
+    
+    def close(self):
+        self.conn.close()
+
+class ReaderPool:
+    """Bounded pool of read-only connections for status/results queries"""
+    
+    def __init__(self, size):
+        self._pool = asyncio.Queue(maxsize=size)
+        for _ in range(size):
+            self._pool.put_nowait(_connect(read_only=True))
+    
+    @asynccontextmanager
+    async def acquire(self):
+        conn = await self._pool.get()
+        try:
+            yield conn
+        finally:
+            self._pool.put_nowait(conn)
+    
+    def close(self):
+        while not self._pool.empty():
+            self._pool.get_nowait().close()
+
 # Initialize database on startup
 init_jobs_db()
 
+# Shared connections and job queue, created in lifespan()
+writer: Optional[WriterConn] = None
+reader_pool: Optional[ReaderPool] = None
+job_queue: Optional[asyncio.Queue] = None
+
+async def _save_upload(upload: UploadFile, path: str):
+    """Stream an upload to disk in chunks without blocking the event loop"""
+    async with aiofiles.open(path, "wb") as buffer:
+        while chunk := await upload.read(UPLOAD_CHUNK_SIZE):
+            await buffer.write(chunk)
+
+def _pack_detections(detections: List[Dict[str, Any]]) -> bytes:
+    """Encode detections for the job_results.detection_details column"""
+    return msgpack.packb(detections, use_bin_type=True)
+
+def _unpack_detections(details) -> List[Dict[str, Any]]:
+    """Decode detection_details, including rows written as JSON text before msgpack"""
+    if not details:
+        return []
+    if isinstance(details, str):
+        return json.loads(details)
+    return msgpack.unpackb(details, raw=False)
+
+def _remove_temp(path: str):
+    """Delete a temp file, ignoring it if it is already gone"""
+    try:
+        os.unlink(path)
+    except FileNotFoundError:
+        pass
+
+async def _job_worker():
+    """Run queued background jobs one at a time"""
+    while True:
+        job, args = await job_queue.get()
+        try:
+            await job(*args)
+        except Exception as e:
+            print(f"Background job error: {e}")
+        finally:
+            job_queue.task_done()
+
+def _enqueue_job(job, *args):
+    """Queue a background job, or raise 503 when the queue is full"""
+    try:
+        job_queue.put_nowait((job, args))
+    except asyncio.QueueFull:
+        raise HTTPException(status_code=503, detail="Too many jobs queued, try again later")
+
 # Health check endpoint
 @app.get("/health")
 async def health_check():
@@ -209,16 +419,13 @@ async def detect_single_image(
         if not file.content_type.startswith('image/'):
             raise HTTPException(status_code=400, detail="File must be an image")
         
-        # Save uploaded file temporarily
-        temp_filename = f"temp_{uuid.uuid4().hex}_{file.filename}"
-        with open(temp_filename, "wb") as buffer:
-            shutil.copyfileobj(file.file, buffer)
+        # Decode the upload in memory; no temp file round trip needed
+        data = await file.read()
         
         # Analyze image
-        result, error = detector.analyze_image(temp_filename, confidence_threshold)
-        
-        # Clean up temp file
-        os.remove(temp_filename)
+        result, error = await asyncio.to_thread(
+            detector.analyze_image_bytes, data, confidence_threshold, file.filename
+        )
         
         if error:
             raise HTTPException(status_code=500, detail=f"Detection error: {error}")
@@ -239,15 +446,11 @@ async def detect_single_image(
         }
         
     except Exception as e:
-        # Clean up temp file if it exists
-        if 'temp_filename' in locals() and os.path.exists(temp_filename):
-            os.remove(temp_filename)
         raise HTTPException(status_code=500, detail=str(e))
 
 # Batch image detection
 @app.post("/detect/batch")
 async def detect_batch_images(
-    background_tasks: BackgroundTasks,
     files: List[UploadFile] = File(...),
     confidence_threshold: float = Form(0.5)
 ):
@@ -256,47 +459,54 @@ async def detect_batch_images(
         if len(files) > 50:  # Limit batch size
             raise HTTPException(status_code=400, detail="Maximum 50 files allowed per batch")
         
+        if job_queue.full():
+            raise HTTPException(status_code=503, detail="Too many jobs queued, try again later")
+        
         # Create job
         job_id = str(uuid.uuid4())
         
         # Save job to database
-        conn = sqlite3.connect(jobs_db)
-        cursor = conn.cursor()
-        cursor.execute('''
-            INSERT INTO batch_jobs (id, status, total_images)
-            VALUES (?, ?, ?)
-        ''', (job_id, "processing", len(files)))
-        conn.commit()
-        conn.close()
+        async with writer.transaction() as cursor:
+            cursor.execute('''
+                INSERT INTO batch_jobs (id, status, total_images)
+                VALUES (?, ?, ?)
+            ''', (job_id, "processing", len(files)))
         
         # Save files temporarily
-        temp_files = []
-        for file in files:
-            if not file.content_type.startswith('image/'):
-                continue
-            
-            temp_filename = f"temp_{job_id}_{file.filename}"
-            with open(temp_filename, "wb") as buffer:
-                shutil.copyfileobj(file.file, buffer)
-            temp_files.append((temp_filename, file.filename))
-        
-        # Start background processing
-        background_tasks.add_task(
-            process_batch_job, 
-            job_id, 
-            temp_files, 
-            confidence_threshold
-        )
+        image_files = [file for file in files if file.content_type.startswith('image/')]
+        temp_files = [(f"temp_{job_id}_{file.filename}", file.filename) for file in image_files]
+        
+        upload_slots = asyncio.Semaphore(UPLOAD_CONCURRENCY)
+        
+        async def save(file, temp_filename):
+            async with upload_slots:
+                await _save_upload(file, temp_filename)
+        
+        await asyncio.gather(*(
+            save(file, temp_filename)
+            for file, (temp_filename, _) in zip(image_files, temp_files)
+        ))
+        
+        # Queue background processing
+        try:
+            _enqueue_job(process_batch_job, job_id, temp_files, confidence_threshold)
+        except HTTPException as e:
+            # The queue filled up while files were being saved
+            for temp_filename, _ in temp_files:
+                _remove_temp(temp_filename)
+            await _mark_job_failed(job_id, e.detail)
+            raise
         
         return {"job_id": job_id, "status": "processing", "total_images": len(temp_files)}
         
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 # Apple Photos detection
 @app.post("/detect/apple-photos")
 async def detect_apple_photos(
-    background_tasks: BackgroundTasks,
     confidence_threshold: float = Form(0.5),
     limit: int = Form(100)
 ):
@@ -304,106 +514,100 @@ async def detect_apple_photos(
     try:
         job_id = str(uuid.uuid4())
         
-        # Start background processing
-        background_tasks.add_task(
-            process_apple_photos_job,
-            job_id,
-            confidence_threshold,
-            limit
-        )
+        # Queue background processing
+        _enqueue_job(process_apple_photos_job, job_id, confidence_threshold, limit)
         
         return {"job_id": job_id, "status": "processing", "message": "Apple Photos analysis started"}
         
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 # Job status endpoint
-@app.get("/jobs/{job_id}/status")
+@app.get("/jobs/{job_id}/status", response_model=BatchJobStatus, response_model_exclude_none=True)
 async def get_job_status(job_id: str):
     """Get status of a batch job"""
     try:
-        conn = sqlite3.connect(jobs_db)
-        cursor = conn.cursor()
-        
-        cursor.execute('''
-            SELECT status, total_images, processed_images, error_message
-            FROM batch_jobs WHERE id = ?
-        ''', (job_id,))
-        
-        result = cursor.fetchone()
-        conn.close()
+        async with reader_pool.acquire() as conn:
+            def read_status():
+                return conn.execute('''
+                    SELECT status, total_images, processed_images, error_message
+                    FROM batch_jobs WHERE id = ?
+                ''', (job_id,)).fetchone()
+            
+            row = await asyncio.to_thread(read_status)
         
-        if not result:
+        if not row:
             raise HTTPException(status_code=404, detail="Job not found")
         
-        status, total, processed, error = result
-        
-        response = {
-            "job_id": job_id,
-            "status": status,
-            "progress": {
-                "total": total or 0,
-                "processed": processed or 0
-            }
-        }
-        
-        if error:
-            response["error"] = error
-            
-        return response
+        return BatchJobStatus(
+            job_id=job_id,
+            status=row["status"],
+            progress={
+                "total": row["total_images"] or 0,
+                "processed": row["processed_images"] or 0
+            },
+            error=row["error_message"] or None
+        )
         
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 # Job results endpoint
 @app.get("/jobs/{job_id}/results")
-async def get_job_results(job_id: str):
-    """Get results of a completed batch job"""
+async def get_job_results(job_id: str, limit: Optional[int] = None, offset: int = 0):
+    """Get results of a completed batch job, optionally paginated with limit/offset"""
     try:
-        conn = sqlite3.connect(jobs_db)
-        cursor = conn.cursor()
-        
-        # Check job status
-        cursor.execute('SELECT status FROM batch_jobs WHERE id = ?', (job_id,))
-        job_result = cursor.fetchone()
-        
-        if not job_result:
-            raise HTTPException(status_code=404, detail="Job not found")
-        
-        if job_result[0] != "completed":
-            raise HTTPException(status_code=400, detail="Job not completed yet")
-        
-        # Get results
-        cursor.execute('''
-            SELECT filename, cigarette_detected, max_confidence, detection_details
-            FROM job_results WHERE job_id = ?
-        ''', (job_id,))
-        
-        results = []
-        total_detected = 0
-        
-        for row in cursor.fetchall():
-            filename, detected, confidence, details = row
-            
-            if detected:
-                total_detected += 1
+        async with reader_pool.acquire() as conn:
+            def read_results():
+                cursor = conn.cursor()
+                
+                # Check job status
+                cursor.execute('SELECT status FROM batch_jobs WHERE id = ?', (job_id,))
+                job_result = cursor.fetchone()
+                
+                if not job_result:
+                    raise HTTPException(status_code=404, detail="Job not found")
+                
+                if job_result["status"] != "completed":
+                    raise HTTPException(status_code=400, detail="Job not completed yet")
+                
+                # Summarize the whole job in SQL, independent of pagination
+                total_images, total_detected = cursor.execute('''
+                    SELECT COUNT(*), COALESCE(SUM(cigarette_detected), 0)
+                    FROM job_results WHERE job_id = ?
+                ''', (job_id,)).fetchone()
+                
+                # Get results (LIMIT -1 means no limit in SQLite)
+                cursor.arraysize = 256
+                cursor.execute('''
+                    SELECT filename, cigarette_detected, max_confidence, detection_details
+                    FROM job_results WHERE job_id = ?
+                    ORDER BY id LIMIT ? OFFSET ?
+                ''', (job_id, -1 if limit is None else limit, offset))
+                
+                results = [
+                    {
+                        "filename": row["filename"],
+                        "cigarette_detected": bool(row["cigarette_detected"]),
+                        "max_confidence": row["max_confidence"],
+                        "detections": _unpack_detections(row["detection_details"])
+                    }
+                    for row in cursor
+                ]
+                return results, total_images, total_detected
             
-            results.append({
-                "filename": filename,
-                "cigarette_detected": bool(detected),
-                "max_confidence": confidence,
-                "detections": json.loads(details) if details else []
-            })
-        
-        conn.close()
+            # Run the queries and decoding off the event loop
+            results, total_images, total_detected = await asyncio.to_thread(read_results)
         
         return {
             "job_id": job_id,
             "results": results,
             "summary": {
-                "total_images": len(results),
+                "total_images": total_images,
                 "images_with_cigarettes": total_detected,
-                "detection_rate": (total_detected / len(results) * 100) if results else 0
+                "detection_rate": (total_detected / total_images * 100) if total_images else 0
             }
         }
         
@@ -437,7 +641,8 @@ async def enable_app_protection(request: dict):
 async def disable_app_protection():
     """Disable app protection"""
     try:
-        protection_system.stop_protection()
+        # Stopping waits for an in-flight integrity check, which may be hashing
+        await asyncio.to_thread(protection_system.stop_protection)
         return {"status": "success", "message": "App protection disabled"}
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to disable protection: {e}")
@@ -451,145 +656,183 @@ async def get_protection_status(device_id: str = "unknown_device"):
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to get protection status: {e}")
 
+@app.get("/status")
+async def get_combined_status(device_id: str = "unknown_device"):
+    """Health, monitoring stats and protection status in one round trip for polling clients"""
+    try:
+        stats = await self_get_monitoring_stats(device_id)
+        protection = await asyncio.to_thread(protection_system.get_protection_status, device_id)
+        return {
+            "health": await health_check(),
+            "stats": stats,
+            "protection": protection,
+        }
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Failed to get status: {e}")
+
 # Background task functions
+async def _mark_job_failed(job_id: str, error: str):
+    """Record a job failure in the database"""
+    async with writer.transaction() as cursor:
+        cursor.execute('''
+            UPDATE batch_jobs 
+            SET status = ?, error_message = ? 
+            WHERE id = ?
+        ''', ("failed", error, job_id))
+
+async def _flush_results(job_id: str, rows: List[tuple], processed: int):
+    """Write a batch of job_results rows and the progress counter in one transaction"""
+    async with writer.transaction() as cursor:
+        if rows:
+            cursor.executemany('''
+                INSERT INTO job_results 
+                (job_id, filename, cigarette_detected, max_confidence, detection_details)
+                VALUES (?, ?, ?, ?, ?)
+            ''', rows)
+        
+        cursor.execute('''
+            UPDATE batch_jobs 
+            SET processed_images = ? 
+            WHERE id = ?
+        ''', (processed, job_id))
+    rows.clear()
+
+async def _analyze_chunk(paths: List[str], confidence_threshold: float):
+    """Analyze a chunk of images as batched forward passes on the default executor.
+
+    Returns one (result, error) pair or exception per path, in order.
+    """
+    groups = [
+        paths[start:start + INFERENCE_BATCH_SIZE]
+        for start in range(0, len(paths), INFERENCE_BATCH_SIZE)
+    ]
+    group_outcomes = await asyncio.gather(*(
+        asyncio.to_thread(detector.analyze_batch, group, confidence_threshold)
+        for group in groups
+    ), return_exceptions=True)
+    
+    outcomes = []
+    for group, group_outcome in zip(groups, group_outcomes):
+        if isinstance(group_outcome, Exception):
+            outcomes.extend([group_outcome] * len(group))
+        else:
+            outcomes.extend(group_outcome)
+    return outcomes
+
 async def process_batch_job(job_id: str, temp_files: List[tuple], confidence_threshold: float):
     """Process batch job in background"""
     try:
-        conn = sqlite3.connect(jobs_db)
-        cursor = conn.cursor()
-        
         processed = 0
+        pending = []
         
-        for temp_filename, original_filename in temp_files:
-            try:
-                # Analyze image
-                result, error = detector.analyze_image(temp_filename, confidence_threshold)
-                
-                if not error:
-                    # Save result to database
-                    cursor.execute('''
-                        INSERT INTO job_results 
-                        (job_id, filename, cigarette_detected, max_confidence, detection_details)
-                        VALUES (?, ?, ?, ?, ?)
-                    ''', (
-                        job_id,
-                        original_filename,
-                        result["cigarette_detected"],
-                        result["max_confidence"],
-                        json.dumps(result["detections"])
-                    ))
-                
-                processed += 1
-                
-                # Update progress
-                cursor.execute('''
-                    UPDATE batch_jobs 
-                    SET processed_images = ? 
-                    WHERE id = ?
-                ''', (processed, job_id))
-                
-                conn.commit()
+        for start in range(0, len(temp_files), RESULTS_BATCH_SIZE):
+            chunk = temp_files[start:start + RESULTS_BATCH_SIZE]
+            outcomes = await _analyze_chunk([path for path, _ in chunk], confidence_threshold)
+            
+            for (temp_filename, original_filename), outcome in zip(chunk, outcomes):
+                try:
+                    if isinstance(outcome, Exception):
+                        raise outcome
+                    
+                    result, error = outcome
+                    if not error:
+                        pending.append((
+                            job_id,
+                            original_filename,
+                            result["cigarette_detected"],
+                            result["max_confidence"],
+                            _pack_detections(result["detections"])
+                        ))
+                    
+                except Exception as e:
+                    print(f"Error processing {original_filename}: {e}")
                 
                 # Clean up temp file
-                os.remove(temp_filename)
-                
-            except Exception as e:
-                print(f"Error processing {original_filename}: {e}")
-                if os.path.exists(temp_filename):
-                    os.remove(temp_filename)
+                _remove_temp(temp_filename)
+            
+            processed += len(chunk)
+            await _flush_results(job_id, pending, processed)
         
         # Mark job as completed
-        cursor.execute('''
-            UPDATE batch_jobs 
-            SET status = ?, completed_at = CURRENT_TIMESTAMP 
-            WHERE id = ?
-        ''', ("completed", job_id))
-        
-        conn.commit()
-        conn.close()
+        async with writer.transaction() as cursor:
+            cursor.execute('''
+                UPDATE batch_jobs 
+                SET status = ?, completed_at = CURRENT_TIMESTAMP 
+                WHERE id = ?
+            ''', ("completed", job_id))
         
     except Exception as e:
         # Mark job as failed
-        conn = sqlite3.connect(jobs_db)
-        cursor = conn.cursor()
-        cursor.execute('''
-            UPDATE batch_jobs 
-            SET status = ?, error_message = ? 
-            WHERE id = ?
-        ''', ("failed", str(e), job_id))
-        conn.commit()
-        conn.close()
+        await _mark_job_failed(job_id, str(e))
 
 async def process_apple_photos_job(job_id: str, confidence_threshold: float, limit: int):
     """Process Apple Photos in background"""
     try:
         # Get Apple Photos
-        photos = detector.get_apple_photos(limit)
+        photos = await asyncio.to_thread(detector.get_apple_photos, limit)
         
         if not photos:
             raise Exception("No photos found or unable to access Apple Photos")
         
         # Save job to database
-        conn = sqlite3.connect(jobs_db)
-        cursor = conn.cursor()
-        cursor.execute('''
-            INSERT INTO batch_jobs (id, status, total_images)
-            VALUES (?, ?, ?)
-        ''', (job_id, "processing", len(photos)))
-        conn.commit()
+        async with writer.transaction() as cursor:
+            cursor.execute('''
+                INSERT OR IGNORE INTO batch_jobs (id, status, total_images)
+                VALUES (?, ?, ?)
+            ''', (job_id, "processing", len(photos)))
         
         processed = 0
+        pending = []
         
-        for photo_path in photos:
-            try:
-                result, error = detector.analyze_image(photo_path, confidence_threshold)
-                
-                if not error:
-                    cursor.execute('''
-                        INSERT INTO job_results 
-                        (job_id, filename, cigarette_detected, max_confidence, detection_details)
-                        VALUES (?, ?, ?, ?, ?)
-                    ''', (
-                        job_id,
-                        os.path.basename(photo_path),
-                        result["cigarette_detected"],
-                        result["max_confidence"],
-                        json.dumps(result["detections"])
-                    ))
-                
-                processed += 1
-                cursor.execute('''
-                    UPDATE batch_jobs 
-                    SET processed_images = ? 
-                    WHERE id = ?
-                ''', (processed, job_id))
-                conn.commit()
-                
-            except Exception as e:
-                print(f"Error processing {photo_path}: {e}")
+        # Resolve display names once, outside the per-result loop
+        photo_names = [(photo_path, os.path.basename(photo_path)) for photo_path in photos]
         
-        # Mark as completed
-        cursor.execute('''
-            UPDATE batch_jobs 
-            SET status = ?, completed_at = CURRENT_TIMESTAMP 
-            WHERE id = ?
-        ''', ("completed", job_id))
+        for start in range(0, len(photo_names), RESULTS_BATCH_SIZE):
+            chunk = photo_names[start:start + RESULTS_BATCH_SIZE]
+            outcomes = await _analyze_chunk([path for path, _ in chunk], confidence_threshold)
+            
+            for (photo_path, photo_name), outcome in zip(chunk, outcomes):
+                try:
+                    if isinstance(outcome, Exception):
+                        raise outcome
+                    
+                    result, error = outcome
+                    if not error:
+                        pending.append((
+                            job_id,
+                            photo_name,
+                            result["cigarette_detected"],
+                            result["max_confidence"],
+                            _pack_detections(result["detections"])
+                        ))
+                    
+                except Exception as e:
+                    print(f"Error processing {photo_path}: {e}")
+            
+            processed += len(chunk)
+            await _flush_results(job_id, pending, processed)
         
-        conn.commit()
-        conn.close()
+        # Mark as completed
+        async with writer.transaction() as cursor:
+            cursor.execute('''
+                UPDATE batch_jobs 
+                SET status = ?, completed_at = CURRENT_TIMESTAMP 
+                WHERE id = ?
+            ''', ("completed", job_id))
         
     except Exception as e:
-        conn = sqlite3.connect(jobs_db)
-        cursor = conn.cursor()
-        cursor.execute('''
-            UPDATE batch_jobs 
-            SET status = ?, error_message = ? 
-            WHERE id = ?
-        ''', ("failed", str(e), job_id))
-        conn.commit()
-        conn.close()
+        await _mark_job_failed(job_id, str(e))
 
 if __name__ == "__main__":
     import uvicorn
     # Disable HTTP access logs to avoid noisy per-request INFO lines
-    uvicorn.run(app, host="127.0.0.1", port=8000, access_log=False)
+    uvicorn.run(
+        app,
+        host="127.0.0.1",
+        port=8000,
+        access_log=False,
+        ws_ping_interval=20,
+        ws_ping_timeout=20,
+    )
@@ -6,8 +6,9 @@ Monitors for app removal and sends notifications to parents
 
 import os
 import sys
-import time
 import threading
+import signal
+import asyncio
 import sqlite3
 import json
 # Email functionality temporarily disabled due to Python email module issues
@@ -15,15 +16,114 @@ import json
 # from email.mime.text import MimeText
 # from email.mime.multipart import MimeMultipart
 import hashlib
+import html
 import platform
 import subprocess
 import requests
 from datetime import datetime, timedelta
 from pathlib import Path
 import psutil
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor
+
+try:
+    import blake3
+except ImportError:  # optional, faster integrity hashing
+    blake3 = None
+
+# Resolved once at import; none of these change while the process runs
+_IS_FROZEN = getattr(sys, "frozen", False)
+_HOME_DIR = os.path.expanduser("~")
+_APP_SUPPORT_DIR = os.path.join(_HOME_DIR, "Library", "Application Support", "EscVapeDetector")
+_EMERGENCY_LOG_PATH = os.path.join(_HOME_DIR, ".cigarette_detection_emergency.log")
+_SERVICE_FILE_PATH = os.path.join(_HOME_DIR, ".cigarette_detection_service.json")
+
+# Read size when hashing; keeps memory flat for large model weights
+HASH_CHUNK_SIZE = 1 << 20
+
+# Statements reused on every check; kept as constants so the connection's
+# statement cache always sees the identical text
+STATEMENT_CACHE_SIZE = 128
+
+_SQL_HEARTBEAT = '''
+    UPDATE app_status 
+    SET last_heartbeat = CURRENT_TIMESTAMP 
+    WHERE device_id = ?
+'''
+
+_SQL_INSERT_ALERT = '''
+    INSERT INTO deletion_alerts 
+    (device_id, alert_type, file, details, parent_email)
+    VALUES (?, ?, ?, ?, ?)
+'''
+
+_SQL_UPSERT_INTEGRITY = '''
+    INSERT OR REPLACE INTO file_integrity 
+    (file_path, file_hash, algo, mtime_ns, size, last_checked, status)
+    VALUES (?, ?, ?, ?, ?, CURRENT_TIMESTAMP, 'OK')
+'''
+
+_SQL_SELECT_INTEGRITY = 'SELECT file_path, file_hash, algo, mtime_ns, size FROM file_integrity ORDER BY id'
+
+_SQL_MARK_SENT = '''
+    UPDATE deletion_alerts 
+    SET email_sent = TRUE 
+    WHERE device_id = ? AND email_sent = FALSE
+'''
+
+_SQL_STATUS = '''
+    SELECT last_heartbeat, protection_enabled, created_at 
+    FROM app_status WHERE device_id = ?
+'''
+
+# Tampering notification email, split around the per-issue list items
+_ALERT_HTML_PREFIX = """
+<html>
+<body>
+    <h2>🚨 Security Alert</h2>
+    <p><strong>Device:</strong> {device_id}</p>
+    <p><strong>Time:</strong> {timestamp}</p>
+    
+    <h3>⚠️ Detected Issues:</h3>
+    <ul>
+"""
+
+_ALERT_HTML_ITEM = "<li><strong>{type}:</strong> {message}</li>"
+
+_ALERT_HTML_SUFFIX = """
+    </ul>
+    
+    <h3>🔍 Possible Causes:</h3>
+    <ul>
+        <li>App was uninstalled or deleted</li>
+        <li>Critical files were modified or removed</li>
+        <li>App directory was moved or renamed</li>
+        <li>System was reset or restored</li>
+    </ul>
+    
+    <h3>📋 Recommended Actions:</h3>
+    <ul>
+        <li>Check the device immediately</li>
+        <li>Verify app installation status</li>
+        <li>Reinstall if necessary</li>
+        <li>Review device access logs</li>
+    </ul>
+    
+    <hr>
+    <p><small>Cigarette Detection System - Security Monitoring</small></p>
+</body>
+</html>
+"""
 
 class AppProtectionSystem:
-    def __init__(self, app_directory=None, parent_email=None):
+    __slots__ = (
+        'app_directory', 'parent_email', 'hash_algo', 'protection_db',
+        'heartbeat_interval', 'is_running', 'protection_thread', 'device_id',
+        'critical_files', '_critical_abs', '_hash_cache', '_pool',
+        '_conn', '_lock', '_loop', '_stop_evt',
+    )
+    
+    def __init__(self, app_directory=None, parent_email=None, hash_algo='sha256'):
         # Determine base application directory
         if app_directory is not None:
             base_dir = app_directory
@@ -32,13 +132,8 @@ class AppProtectionSystem:
 
         # When frozen (py2app/pyinstaller), write protection data to a
         # user-writable directory instead of the app bundle.
-        if getattr(sys, "frozen", False):
-            user_base = os.path.join(
-                os.path.expanduser("~"),
-                "Library",
-                "Application Support",
-                "EscVapeDetector",
-            )
+        if _IS_FROZEN:
+            user_base = _APP_SUPPORT_DIR
             try:
                 os.makedirs(user_base, exist_ok=True)
                 self.app_directory = user_base
@@ -48,10 +143,14 @@ class AppProtectionSystem:
         else:
             self.app_directory = base_dir
         self.parent_email = parent_email
+        # 'blake3' is used only when the package is installed
+        self.hash_algo = 'blake3' if hash_algo == 'blake3' and blake3 is not None else 'sha256'
         self.protection_db = os.path.join(self.app_directory, "protection.db")
         self.heartbeat_interval = 300  # 5 minutes
         self.is_running = False
         self.protection_thread = None
+        self._loop = None
+        self._stop_evt = threading.Event()
         
         # Critical files to monitor
         self.critical_files = [
@@ -63,8 +162,59 @@ class AppProtectionSystem:
             "models/yolov4.weights",
             "models/yolov4.cfg"
         ]
+        # (relative, absolute) pairs; app_directory is fixed after __init__
+        self._critical_abs = tuple(
+            (file_path, os.path.join(self.app_directory, file_path))
+            for file_path in self.critical_files
+        )
+        
+        # (full_path, algo) -> (mtime_ns, size, hex digest); avoids re-reading
+        # unchanged files (notably yolov4.weights) on every check
+        self._hash_cache = {}
+        # Hashing releases the GIL, so small files finish while the weights hash
+        self._pool = None
+        
+        # One autocommit connection shared by the monitor thread and callers;
+        # the lock serializes use, transactions are explicit
+        self._conn = None
+        self._lock = threading.Lock()
         
         self.init_protection_db()
+    
+    def _connect(self):
+        conn = sqlite3.connect(
+            self.protection_db,
+            check_same_thread=False,
+            isolation_level=None,
+            cached_statements=STATEMENT_CACHE_SIZE,
+        )
+        # WAL + NORMAL: one fsync per checkpoint rather than per heartbeat
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute('PRAGMA synchronous=NORMAL')
+        conn.execute('PRAGMA temp_store=MEMORY')
+        return conn
+    
+    def _close_connection(self):
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+    
+    @contextmanager
+    def _transaction(self):
+        """Yield a cursor inside BEGIN/COMMIT on the shared connection"""
+        with self._lock:
+            if self._conn is None:
+                self._conn = self._connect()
+            conn = self._conn
+            conn.execute('BEGIN')
+            try:
+                yield conn.cursor()
+            except BaseException:
+                if conn.in_transaction:
+                    conn.execute('ROLLBACK')
+                raise
+            conn.execute('COMMIT')
         
     def init_protection_db(self):
         """Initialize protection database"""
@@ -74,9 +224,10 @@ class AppProtectionSystem:
         except Exception:
             pass
 
-        conn = sqlite3.connect(self.protection_db)
-        cursor = conn.cursor()
-        
+        with self._transaction() as cursor:
+            self._create_schema(cursor)
+    
+    def _create_schema(self, cursor):
         cursor.execute('''
             CREATE TABLE IF NOT EXISTS app_status (
                 id INTEGER PRIMARY KEY AUTOINCREMENT,
@@ -112,168 +263,277 @@ class AppProtectionSystem:
             )
         ''')
         
-        conn.commit()
-        conn.close()
+        # Older databases predate these columns; their integrity rows are
+        # SHA-256 with no stat signature, so they are always re-hashed, and
+        # their alerts keep the whole issue as JSON in details
+        for table, column in (
+            ("file_integrity", "algo TEXT DEFAULT 'sha256'"),
+            ("file_integrity", "mtime_ns INTEGER"),
+            ("file_integrity", "size INTEGER"),
+            ("deletion_alerts", "file TEXT"),
+        ):
+            try:
+                cursor.execute(f"ALTER TABLE {table} ADD COLUMN {column}")
+            except sqlite3.OperationalError:
+                pass
+        
+        # Partial index: only unsent alerts are ever looked up, so sent rows
+        # never enter it
+        cursor.execute(
+            "CREATE INDEX IF NOT EXISTS idx_alerts_unsent ON deletion_alerts(device_id) "
+            "WHERE email_sent = FALSE"
+        )
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_app_status_device ON app_status(device_id)")
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_integrity_path ON file_integrity(file_path)")
     
-    def calculate_app_hash(self):
-        """Calculate hash of critical app files"""
-        hasher = hashlib.sha256()
-        
-        for file_path in self.critical_files:
-            full_path = os.path.join(self.app_directory, file_path)
-            if os.path.exists(full_path):
-                with open(full_path, 'rb') as f:
-                    hasher.update(f.read())
+    def _hash_file(self, full_path, algo=None):
+        """Digest of a file, memoized on its (mtime_ns, size) stat signature
         
-        return hasher.hexdigest()
+        Returns None if the file does not exist; the single stat doubles as
+        the existence check.
+        """
+        algo = algo or self.hash_algo
+        try:
+            st = os.stat(full_path)
+        except FileNotFoundError:
+            return None
+        key = (st.st_mtime_ns, st.st_size)
+        cached = self._hash_cache.get((full_path, algo))
+        if cached is not None and cached[:2] == key:
+            return cached[2]
+        
+        # Incremental update() keeps OpenSSL on its SHA-NI code path
+        hasher = blake3.blake3() if algo == 'blake3' else hashlib.sha256()
+        with open(full_path, 'rb', buffering=0) as f:
+            for chunk in iter(lambda: f.read(HASH_CHUNK_SIZE), b''):
+                hasher.update(chunk)
+        file_hash = hasher.hexdigest()
+        self._hash_cache[(full_path, algo)] = key + (file_hash,)
+        return file_hash
+    
+    def _hash_files(self, full_paths, algos=None):
+        """Hash several files concurrently, preserving order"""
+        if self._pool is None:
+            self._pool = ThreadPoolExecutor(max_workers=min(4, len(self.critical_files)))
+        if algos is None:
+            return list(self._pool.map(self._hash_file, full_paths))
+        return list(self._pool.map(self._hash_file, full_paths, algos))
+    
+    def calculate_app_hash(self):
+        """Calculate hash of critical app files
+        
+        Root over the per-file digests (path-tagged, sorted), so only files
+        whose stat signature changed are re-read to recompute it.
+        """
+        hashes = self._hash_files([full_path for _, full_path in self._critical_abs])
+        leaves = sorted(
+            f"{file_path}:{file_hash}"
+            for (file_path, _), file_hash in zip(self._critical_abs, hashes)
+            if file_hash is not None
+        )
+        return hashlib.sha256("\n".join(leaves).encode()).hexdigest()
     
     def register_installation(self, device_id, parent_email):
         """Register app installation with protection"""
-        conn = sqlite3.connect(self.protection_db)
-        cursor = conn.cursor()
-        
+        # Hash outside the transaction so the database is not held during I/O
         app_hash = self.calculate_app_hash()
+        integrity_rows = self._file_integrity_rows()
         
-        # Check if already registered
-        cursor.execute('SELECT id FROM app_status WHERE device_id = ?', (device_id,))
-        existing = cursor.fetchone()
-        
-        if existing:
-            # Update existing registration
-            cursor.execute('''
-                UPDATE app_status 
-                SET parent_email = ?, app_hash = ?, last_heartbeat = CURRENT_TIMESTAMP,
-                    installation_path = ?, protection_enabled = TRUE
-                WHERE device_id = ?
-            ''', (parent_email, app_hash, self.app_directory, device_id))
-        else:
-            # New registration
-            cursor.execute('''
-                INSERT INTO app_status 
-                (device_id, parent_email, app_hash, installation_path)
-                VALUES (?, ?, ?, ?)
-            ''', (device_id, parent_email, app_hash, self.app_directory))
-        
-        # Store file integrity hashes
-        self.update_file_integrity()
-        
-        conn.commit()
-        conn.close()
+        with self._transaction() as cursor:
+            # Check if already registered
+            cursor.execute('SELECT id FROM app_status WHERE device_id = ?', (device_id,))
+            existing = cursor.fetchone()
+            
+            if existing:
+                # Update existing registration
+                cursor.execute('''
+                    UPDATE app_status 
+                    SET parent_email = ?, app_hash = ?, last_heartbeat = CURRENT_TIMESTAMP,
+                        installation_path = ?, protection_enabled = TRUE
+                    WHERE device_id = ?
+                ''', (parent_email, app_hash, self.app_directory, device_id))
+            else:
+                # New registration
+                cursor.execute('''
+                    INSERT INTO app_status 
+                    (device_id, parent_email, app_hash, installation_path)
+                    VALUES (?, ?, ?, ?)
+                ''', (device_id, parent_email, app_hash, self.app_directory))
+            
+            # Store file integrity hashes
+            self._store_file_integrity(cursor, integrity_rows)
         
         self.parent_email = parent_email
         return True
     
+    def _file_integrity_rows(self):
+        rows = []
+        hashes = self._hash_files([full_path for _, full_path in self._critical_abs])
+        for (file_path, full_path), file_hash in zip(self._critical_abs, hashes):
+            if file_hash is None:
+                continue
+            # The stat signature _hash_file recorded alongside the digest
+            mtime_ns, size, _ = self._hash_cache[(full_path, self.hash_algo)]
+            rows.append((file_path, file_hash, self.hash_algo, mtime_ns, size))
+        return rows
+    
+    def _store_file_integrity(self, cursor, rows):
+        cursor.executemany(_SQL_UPSERT_INTEGRITY, rows)
+    
     def update_file_integrity(self):
         """Update file integrity database"""
-        conn = sqlite3.connect(self.protection_db)
-        cursor = conn.cursor()
-        
-        for file_path in self.critical_files:
-            full_path = os.path.join(self.app_directory, file_path)
-            if os.path.exists(full_path):
-                with open(full_path, 'rb') as f:
-                    file_hash = hashlib.sha256(f.read()).hexdigest()
-                
-                cursor.execute('''
-                    INSERT OR REPLACE INTO file_integrity 
-                    (file_path, file_hash, last_checked, status)
-                    VALUES (?, ?, CURRENT_TIMESTAMP, 'OK')
-                ''', (file_path, file_hash))
-        
-        conn.commit()
-        conn.close()
+        rows = self._file_integrity_rows()
+        with self._transaction() as cursor:
+            self._store_file_integrity(cursor, rows)
     
-    def check_file_integrity(self):
-        """Check if critical files have been modified or deleted"""
-        conn = sqlite3.connect(self.protection_db)
-        cursor = conn.cursor()
-        
-        cursor.execute('SELECT file_path, file_hash FROM file_integrity')
-        stored_files = cursor.fetchall()
-        
-        issues = []
-        
-        for file_path, stored_hash in stored_files:
-            full_path = os.path.join(self.app_directory, file_path)
-            
-            if not os.path.exists(full_path):
-                issues.append({
-                    'type': 'FILE_DELETED',
-                    'file': file_path,
-                    'message': f'Critical file deleted: {file_path}'
-                })
-            else:
-                with open(full_path, 'rb') as f:
-                    current_hash = hashlib.sha256(f.read()).hexdigest()
-                
-                if current_hash != stored_hash:
-                    issues.append({
-                        'type': 'FILE_MODIFIED',
-                        'file': file_path,
-                        'message': f'Critical file modified: {file_path}'
-                    })
-        
-        conn.close()
-        return issues
+    def _snapshot_dir(self, rel_paths):
+        """Map relative paths to DirEntry objects with one scandir per parent
+        
+        Missing files are absent from the result. Returns None when the app
+        directory itself cannot be listed.
+        """
+        by_parent = {}
+        for rel_path in rel_paths:
+            parent, name = os.path.split(rel_path)
+            by_parent.setdefault(parent, set()).add(name)
+        
+        snapshot = {}
+        for parent, names in by_parent.items():
+            try:
+                with os.scandir(os.path.join(self.app_directory, parent)) as it:
+                    for entry in it:
+                        if entry.name in names:
+                            snapshot[f"{parent}/{entry.name}" if parent else entry.name] = entry
+            except (FileNotFoundError, NotADirectoryError):
+                if not parent:
+                    return None
+        return snapshot
+    
+    def check_file_integrity(self, snapshot=None):
+        """Check if critical files have been modified or deleted
+        
+        Files whose mtime and size match the values recorded at registration
+        are not re-hashed, so an edit that preserves both goes unnoticed; the
+        trade-off avoids reading the model weights on every heartbeat.
+        """
+        with self._transaction() as cursor:
+            cursor.execute(_SQL_SELECT_INTEGRITY)
+            stored_files = cursor.fetchall()
+        
+        # Latest row per path wins (rows are ordered by id)
+        expected = {row[0]: row[1:] for row in stored_files}
+        
+        if snapshot is None:
+            snapshot = self._snapshot_dir(list(expected)) or {}
+        
+        deleted = set(expected.keys() - snapshot.keys())
+        
+        # Stat filter first, then re-hash only what changed, in parallel
+        pending = []
+        for file_path in expected.keys() - deleted:
+            stored_hash, algo, mtime_ns, size = expected[file_path]
+            entry = snapshot[file_path]
+            st = entry.stat()
+            if st.st_mtime_ns == mtime_ns and st.st_size == size:
+                continue
+            # Verify with the algorithm the row was written with
+            if algo == 'blake3' and blake3 is None:
+                continue
+            pending.append((file_path, entry.path, algo or 'sha256'))
+        
+        current_hashes = self._hash_files([p[1] for p in pending], [p[2] for p in pending])
+        # A file removed since the snapshot hashes to None
+        deleted.update(file_path for (file_path, _, _), current_hash in zip(pending, current_hashes)
+                       if current_hash is None)
+        modified = {file_path for (file_path, _, _), current_hash in zip(pending, current_hashes)
+                    if current_hash is not None and current_hash != expected[file_path][0]}
+        
+        return [
+            {'type': 'FILE_DELETED', 'file': file_path, 'message': f'Critical file deleted: {file_path}'}
+            for file_path in expected if file_path in deleted
+        ] + [
+            {'type': 'FILE_MODIFIED', 'file': file_path, 'message': f'Critical file modified: {file_path}'}
+            for file_path in expected if file_path in modified
+        ]
     
     def send_heartbeat(self, device_id):
         """Send heartbeat to indicate app is still running"""
-        conn = sqlite3.connect(self.protection_db)
-        cursor = conn.cursor()
-        
-        cursor.execute('''
-            UPDATE app_status 
-            SET last_heartbeat = CURRENT_TIMESTAMP 
-            WHERE device_id = ?
-        ''', (device_id,))
-        
-        conn.commit()
-        conn.close()
+        with self._transaction() as cursor:
+            cursor.execute(_SQL_HEARTBEAT, (device_id,))
     
     def check_for_tampering(self, device_id):
         """Check for app tampering or deletion attempts"""
+        issues = self._find_tampering()
+        
+        # Log any issues found
+        if issues:
+            self.log_deletion_alert(device_id, issues)
+            return issues
+        
+        return []
+    
+    def _find_tampering(self):
         issues = []
         
+        # One directory listing answers every existence check below
+        db_name = os.path.basename(self.protection_db)
+        snapshot = self._snapshot_dir(self.critical_files + [db_name])
+        
         # Check file integrity
-        file_issues = self.check_file_integrity()
+        file_issues = self.check_file_integrity(snapshot or {})
         issues.extend(file_issues)
         
         # Check if app directory still exists
-        if not os.path.exists(self.app_directory):
+        if snapshot is None:
             issues.append({
                 'type': 'APP_DIRECTORY_DELETED',
                 'message': 'App directory has been deleted'
             })
         
         # Check if protection database is accessible
-        if not os.path.exists(self.protection_db):
+        if not snapshot or db_name not in snapshot:
             issues.append({
                 'type': 'PROTECTION_DB_DELETED',
                 'message': 'Protection database has been deleted'
             })
+            # The open handle still points at the unlinked file; reopen so
+            # later writes see the real state of the path
+            self._close_connection()
         
-        # Log any issues found
-        if issues:
-            self.log_deletion_alert(device_id, issues)
-            return issues
-        
-        return []
+        return issues
+    
+    def _tick_transactional(self, device_id, stop_evt=None):
+        """Heartbeat and tampering check with a single write transaction
+        
+        Detection (stat/hash) runs first without holding the database; the
+        heartbeat update and any alert inserts then commit together. Nothing
+        is written if stop_evt is set while detection runs.
+        """
+        issues = self._find_tampering()
+        if stop_evt is not None and stop_evt.is_set():
+            return []
+        try:
+            with self._transaction() as cursor:
+                cursor.execute(_SQL_HEARTBEAT, (device_id,))
+                if issues:
+                    cursor.executemany(_SQL_INSERT_ALERT, self._alert_rows(device_id, issues))
+        except Exception as e:
+            if not issues:
+                raise
+            # Still report the issues even though they could not be stored
+            self.emergency_log(device_id, issues, str(e))
+        return issues
+    
+    def _alert_rows(self, device_id, issues):
+        return [(device_id, issue['type'], issue.get('file'), issue['message'], self.parent_email)
+                for issue in issues]
     
     def log_deletion_alert(self, device_id, issues):
         """Log deletion/tampering alerts"""
         try:
-            conn = sqlite3.connect(self.protection_db)
-            cursor = conn.cursor()
-            
-            for issue in issues:
-                cursor.execute('''
-                    INSERT INTO deletion_alerts 
-                    (device_id, alert_type, details, parent_email)
-                    VALUES (?, ?, ?, ?)
-                ''', (device_id, issue['type'], json.dumps(issue), self.parent_email))
-            
-            conn.commit()
-            conn.close()
+            rows = self._alert_rows(device_id, issues)
+            with self._transaction() as cursor:
+                cursor.executemany(_SQL_INSERT_ALERT, rows)
         except Exception as e:
             # If database is inaccessible, try alternative logging
             self.emergency_log(device_id, issues, str(e))
@@ -281,14 +541,15 @@ class AppProtectionSystem:
     def emergency_log(self, device_id, issues, error):
         """Emergency logging when database is inaccessible"""
         try:
-            # Try to write to a hidden file
-            emergency_file = os.path.join(os.path.expanduser("~"), ".cigarette_detection_emergency.log")
-            with open(emergency_file, 'a') as f:
-                f.write(f"\n[{datetime.now()}] EMERGENCY LOG - Device: {device_id}\n")
-                f.write(f"Database Error: {error}\n")
-                for issue in issues:
-                    f.write(f"Issue: {issue}\n")
-                f.write("-" * 50 + "\n")
+            # Try to write to a hidden file; one write keeps the record whole
+            lines = [
+                f"\n[{datetime.now()}] EMERGENCY LOG - Device: {device_id}\n",
+                f"Database Error: {error}\n",
+                *(f"Issue: {issue}\n" for issue in issues),
+                "-" * 50 + "\n",
+            ]
+            with open(_EMERGENCY_LOG_PATH, 'a') as f:
+                f.write(''.join(lines))
         except:
             pass  # If even emergency logging fails, continue silently
     
@@ -301,44 +562,16 @@ class AppProtectionSystem:
             # Create email content
             subject = f"🚨 ALERT: Cigarette Detection App Tampering Detected"
             
-            html_body = f"""
-            <html>
-            <body>
-                <h2>🚨 Security Alert</h2>
-                <p><strong>Device:</strong> {device_id}</p>
-                <p><strong>Time:</strong> {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}</p>
-                
-                <h3>⚠️ Detected Issues:</h3>
-                <ul>
-            """
-            
-            for issue in issues:
-                html_body += f"<li><strong>{issue['type']}:</strong> {issue['message']}</li>"
-            
-            html_body += """
-                </ul>
-                
-                <h3>🔍 Possible Causes:</h3>
-                <ul>
-                    <li>App was uninstalled or deleted</li>
-                    <li>Critical files were modified or removed</li>
-                    <li>App directory was moved or renamed</li>
-                    <li>System was reset or restored</li>
-                </ul>
-                
-                <h3>📋 Recommended Actions:</h3>
-                <ul>
-                    <li>Check the device immediately</li>
-                    <li>Verify app installation status</li>
-                    <li>Reinstall if necessary</li>
-                    <li>Review device access logs</li>
-                </ul>
-                
-                <hr>
-                <p><small>Cigarette Detection System - Security Monitoring</small></p>
-            </body>
-            </html>
-            """
+            html_body = _ALERT_HTML_PREFIX.format_map({
+                'device_id': html.escape(str(device_id)),
+                'timestamp': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+            }) + ''.join(
+                _ALERT_HTML_ITEM.format_map({
+                    'type': html.escape(issue['type']),
+                    'message': html.escape(issue['message']),
+                })
+                for issue in issues
+            ) + _ALERT_HTML_SUFFIX
             
             # Send email (using same email system as reports)
             self.send_email_alert(subject, html_body)
@@ -365,77 +598,101 @@ class AppProtectionSystem:
     def mark_alerts_sent(self, device_id):
         """Mark alerts as sent in database"""
         try:
-            conn = sqlite3.connect(self.protection_db)
-            cursor = conn.cursor()
-            
-            cursor.execute('''
-                UPDATE deletion_alerts 
-                SET email_sent = TRUE 
-                WHERE device_id = ? AND email_sent = FALSE
-            ''', (device_id,))
-            
-            conn.commit()
-            conn.close()
+            with self._transaction() as cursor:
+                cursor.execute(_SQL_MARK_SENT, (device_id,))
         except:
             pass  # Fail silently if database is inaccessible
     
     def start_protection(self, device_id):
         """Start protection monitoring"""
-        self.is_running = True
         self.device_id = device_id
+        if self.is_running:
+            # Already monitoring; the running loop picks up the new device_id
+            return True
+        self.is_running = True
         
-        def protection_loop():
-            while self.is_running:
-                try:
-                    # Send heartbeat
-                    self.send_heartbeat(device_id)
-                    
-                    # Check for tampering
-                    issues = self.check_for_tampering(device_id)
-                    
-                    if issues:
-                        # Send notification
-                        self.send_deletion_notification(device_id, issues)
-                        
-                        # Log to console for debugging
-                        print(f"SECURITY ALERT: {len(issues)} issues detected!")
-                        for issue in issues:
-                            print(f"  - {issue['type']}: {issue['message']}")
-                    
-                    # Wait for next check
-                    time.sleep(self.heartbeat_interval)
-                    
-                except Exception as e:
-                    print(f"Protection monitoring error: {e}")
-                    time.sleep(60)  # Wait longer on error
-        
-        # Start protection in background thread
-        self.protection_thread = threading.Thread(target=protection_loop, daemon=True)
+        # Checks are timer callbacks on a private event loop, so stopping
+        # cancels the pending wait instead of sleeping it out. Each run gets
+        # its own loop and stop event, bound into its tick callbacks.
+        loop = asyncio.new_event_loop()
+        stop_evt = threading.Event()
+        self._loop = loop
+        self._stop_evt = stop_evt
+        loop.call_soon(self._tick, loop, stop_evt)
+        self.protection_thread = threading.Thread(target=self._run_loop, args=(loop,), daemon=True)
         self.protection_thread.start()
         
         print(f"App protection started for device: {device_id}")
         return True
     
+    @staticmethod
+    def _run_loop(loop):
+        """Protection thread body; the loop is closed by the thread that ran it"""
+        try:
+            loop.run_forever()
+        finally:
+            loop.close()
+    
+    def _tick(self, loop, stop_evt):
+        """Run one heartbeat/tampering pass and schedule the next on the same loop"""
+        if stop_evt.is_set():
+            return
+        device_id = self.device_id
+        try:
+            # Send heartbeat and check for tampering
+            issues = self._tick_transactional(device_id, stop_evt)
+            
+            # stop_protection is waiting for this pass to end; don't report
+            if stop_evt.is_set():
+                return
+            
+            if issues:
+                # Send notification
+                self.send_deletion_notification(device_id, issues)
+                
+                # Log to console for debugging
+                print(f"SECURITY ALERT: {len(issues)} issues detected!")
+                for issue in issues:
+                    print(f"  - {issue['type']}: {issue['message']}")
+            
+            # Wait for next check
+            delay = self.heartbeat_interval
+            
+        except Exception as e:
+            print(f"Protection monitoring error: {e}")
+            delay = 60  # Wait longer on error
+        
+        if not stop_evt.is_set():
+            loop.call_later(delay, self._tick, loop, stop_evt)
+    
     def stop_protection(self):
         """Stop protection monitoring"""
         self.is_running = False
+        self._stop_evt.set()
+        if self._loop is not None:
+            try:
+                self._loop.call_soon_threadsafe(self._loop.stop)
+            except RuntimeError:
+                pass  # Loop already closed
+            self._loop = None
+        # Wait out an in-flight tick, so it cannot reopen the connection or
+        # recreate the pool after they are released below
         if self.protection_thread:
-            self.protection_thread.join(timeout=5)
+            self.protection_thread.join()
+            self.protection_thread = None
+        self._close_connection()
+        if self._pool is not None:
+            self._pool.shutdown()
+            self._pool = None
         print("App protection stopped")
     
     def get_protection_status(self, device_id):
         """Get current protection status"""
         try:
-            conn = sqlite3.connect(self.protection_db)
-            cursor = conn.cursor()
-            
-            cursor.execute('''
-                SELECT last_heartbeat, protection_enabled, created_at 
-                FROM app_status WHERE device_id = ?
-            ''', (device_id,))
-            
-            result = cursor.fetchone()
-            conn.close()
+            with self._transaction() as cursor:
+                cursor.execute(_SQL_STATUS, (device_id,))
+                
+                result = cursor.fetchone()
             
             if result:
                 last_heartbeat, enabled, created_at = result
@@ -455,9 +712,12 @@ class AppProtectionSystem:
 class ProtectionService:
     """Standalone service that runs independently"""
     
+    __slots__ = ('service_file', 'protection_system', '_exit_evt')
+    
     def __init__(self):
-        self.service_file = os.path.join(os.path.expanduser("~"), ".cigarette_detection_service.json")
+        self.service_file = _SERVICE_FILE_PATH
         self.protection_system = None
+        self._exit_evt = threading.Event()
     
     def install_service(self, device_id, parent_email, app_directory):
         """Install protection service"""
@@ -503,11 +763,16 @@ class ProtectionService:
         
         self.protection_system.start_protection(config['device_id'])
         
-        # Keep service running
+        # Block without periodic wakeups until SIGTERM or Ctrl+C
         try:
-            while True:
-                time.sleep(60)
+            signal.signal(signal.SIGTERM, lambda *_: self._exit_evt.set())
+        except ValueError:
+            pass  # Not on the main thread; rely on KeyboardInterrupt
+        try:
+            self._exit_evt.wait()
         except KeyboardInterrupt:
+            pass
+        finally:
             self.protection_system.stop_protection()
 
 def main():
@@ -7,11 +7,87 @@ Includes image detection, parental control, and app protection features
 import tkinter as tk
 from tkinter import ttk, filedialog, messagebox
 import requests
+from requests.adapters import HTTPAdapter
 import json
+import logging
 import os
+import queue
 from PIL import Image, ImageTk
 import threading
 import time
+import asyncio
+import atexit
+import functools
+import mimetypes
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+try:
+    import orjson
+    
+    def _json_dumps(obj):
+        return orjson.dumps(obj, option=orjson.OPT_SORT_KEYS)
+    
+    _json_loads = orjson.loads
+except ImportError:
+    def _json_dumps(obj):
+        return json.dumps(obj, sort_keys=True, separators=(',', ':')).encode()
+    
+    _json_loads = json.loads
+
+log = logging.getLogger('esc.gui')
+
+# Threads running blocking HTTP calls for the network loop
+HTTP_WORKERS = 4
+
+# How often the Tk thread collects finished requests while any are pending
+COMPLETION_POLL_MS = 20
+
+# Read size for streamed multipart uploads
+UPLOAD_CHUNK_SIZE = 1 << 16
+
+# Bounding box for the selected-image preview
+PREVIEW_SIZE = (200, 200)
+
+# Device id the GUI reports under until the user enters another
+DEFAULT_DEVICE_ID = "desktop_device_001"
+
+# API endpoints, joined to the base URL once at startup
+API_PATHS = {
+    'health': '/health',
+    'status': '/status',
+    'analyze': '/detect/single',
+    'start_monitoring': '/parental-control/start-monitoring',
+    'stop_monitoring': '/parental-control/stop-monitoring',
+    'test_report': '/parental-control/send-test-report',
+    'stats': '/parental-control/stats',
+    'protection_enable': '/protection/enable',
+    'protection_disable': '/protection/disable',
+    'protection_status': '/protection/status',
+}
+
+@functools.lru_cache(maxsize=8)
+def _load_thumbnail(path, mtime_ns, size, max_w, max_h):
+    """Decode and downscale an image once per (path, mtime, size)"""
+    with Image.open(path) as im:
+        # Let the JPEG decoder downscale while decoding
+        im.draft('RGB', (max_w, max_h))
+        im.thumbnail((max_w, max_h))
+        return ImageTk.PhotoImage(im)
+
+def _format_detection_rate(stats):
+    total = stats.get("totalVideosWatched", 0)
+    detected = stats.get("smokingContentDetected", 0)
+    rate = (detected / total * 100) if total > 0 else 0
+    return f"{rate:.1f}%"
+
+# Stats tab rows: (label, stats key, formatter over the stats payload)
+STATS_ITEMS = (
+    ("Total Videos Watched", "totalVideosWatched", lambda stats: str(stats.get("totalVideosWatched", 0))),
+    ("Smoking Content Detected", "smokingContentDetected", lambda stats: str(stats.get("smokingContentDetected", 0))),
+    ("Last Detection", "lastDetection", lambda stats: stats.get("lastDetection", "Never") or "Never"),
+    ("Detection Rate", "detectionRate", _format_detection_rate),
+)
 
 class CigaretteDetectionGUI:
     def __init__(self, root):
@@ -28,10 +104,48 @@ class CigaretteDetectionGUI:
         
         # API configuration
         self.api_base_url = "http://localhost:8000"
+        self._urls = {key: f"{self.api_base_url}{path}" for key, path in API_PATHS.items()}
+        
+        # One keep-alive session so polling reuses sockets to the API
+        self.http = requests.Session()
+        adapter = HTTPAdapter(pool_connections=2, pool_maxsize=8, max_retries=0)
+        self.http.mount('http://', adapter)
+        self.http.mount('https://', adapter)
+        # requests inflates gzip bodies transparently
+        self.http.headers.update({'Connection': 'keep-alive', 'Accept-Encoding': 'gzip, deflate'})
         
         # Variables
         self.monitoring_active = tk.BooleanVar()
         self.protection_enabled = tk.BooleanVar()
+        # Shared by the parental and stats tabs, which may be built in either order
+        self.device_id_var = tk.StringVar(value=DEFAULT_DEVICE_ID)
+        
+        # Widgets of tabs that have not been shown yet
+        self.stats_labels = None
+        self.protection_status_label = None
+        
+        # Network calls run on one long-lived event loop instead of a new
+        # thread per click; completions are handed back to the Tk thread
+        self._loop = asyncio.new_event_loop()
+        # Bounded, so mashing buttons queues requests instead of adding threads
+        self._pool = ThreadPoolExecutor(max_workers=HTTP_WORKERS, thread_name_prefix='esc-http')
+        self._loop.set_default_executor(self._pool)
+        atexit.register(self._pool.shutdown, wait=False)
+        threading.Thread(target=self._loop.run_forever, daemon=True).start()
+        
+        # Requests still running, by (method, endpoint, arguments); Tk thread only
+        self._inflight = {}
+        # Finished futures handed from the network loop to the Tk thread, which
+        # polls for them only while requests are pending
+        self._completions = queue.SimpleQueue()
+        self._pending = 0
+        self._poll_after_id = None
+        
+        # Pending stats poll; only scheduled while the stats tab is shown
+        self._stats_after_id = None
+        # Last values rendered, so unchanged polls skip widget updates
+        self._last_stats = None
+        self._last_protection = None
         
         # Force window to front
         self.root.lift()
@@ -39,7 +153,8 @@ class CigaretteDetectionGUI:
         self.root.after_idle(self.root.attributes, '-topmost', False)
         
         self.setup_ui()
-        self.check_api_connection()
+        # Probe after the first paint so a down server never delays the window
+        self.root.after(100, self.check_api_connection)
     
     def setup_ui(self):
         """Setup the user interface"""
@@ -59,17 +174,24 @@ class CigaretteDetectionGUI:
         # Tab 1: Image Detection
         self.detection_frame = ttk.Frame(self.notebook)
         self.notebook.add(self.detection_frame, text="🔍 Image Detection")
-        self.setup_detection_tab()
         
         # Tab 2: Parental Control
         self.parental_frame = ttk.Frame(self.notebook)
         self.notebook.add(self.parental_frame, text="👨‍👩‍👧‍👦 Parental Control")
-        self.setup_parental_tab()
         
         # Tab 3: Monitoring Stats
         self.stats_frame = ttk.Frame(self.notebook)
         self.notebook.add(self.stats_frame, text="📊 Monitoring Stats")
-        self.setup_stats_tab()
+        
+        # Tab contents are built the first time each tab is shown
+        self._tab_built = {'detection': False, 'parental': False, 'stats': False}
+        self._tab_setup = {
+            str(self.detection_frame): ('detection', self.setup_detection_tab),
+            str(self.parental_frame): ('parental', self.setup_parental_tab),
+            str(self.stats_frame): ('stats', self.setup_stats_tab),
+        }
+        self._build_selected_tab()
+        self.notebook.bind("<<NotebookTabChanged>>", self._on_tab_change)
         
         # Status bar
         self.status_var = tk.StringVar()
@@ -80,32 +202,19 @@ class CigaretteDetectionGUI:
         
         # Force update
         self.root.update_idletasks()
-        print("✅ GUI setup completed")
+        log.debug("GUI setup completed")
     
     def setup_detection_tab(self):
         """Setup image detection tab"""
-        print("🔍 Setting up detection tab...")
-        
-        # Create scrollable frame
-        canvas = tk.Canvas(self.detection_frame)
-        scrollbar = ttk.Scrollbar(self.detection_frame, orient="vertical", command=canvas.yview)
-        scrollable_frame = ttk.Frame(canvas)
-        
-        scrollable_frame.bind(
-            "<Configure>",
-            lambda e: canvas.configure(scrollregion=canvas.bbox("all"))
-        )
-        
-        canvas.create_window((0, 0), window=scrollable_frame, anchor="nw")
-        canvas.configure(yscrollcommand=scrollbar.set)
+        log.debug("Setting up detection tab")
         
         # Title
-        title_label = ttk.Label(scrollable_frame, text="🔍 Vaping and Smoking Detection", 
+        title_label = ttk.Label(self.detection_frame, text="🔍 Vaping and Smoking Detection", 
                                font=("Arial", 16, "bold"))
         title_label.pack(pady=10)
         
         # Test label to verify content is showing
-        test_label = ttk.Label(scrollable_frame, text="Detection tab loaded successfully!", 
+        test_label = ttk.Label(self.detection_frame, text="Detection tab loaded successfully!", 
                               foreground="green")
         test_label.pack(pady=5)
         
@@ -125,6 +234,10 @@ class CigaretteDetectionGUI:
         browse_btn = ttk.Button(file_select_frame, text="Browse", command=self.browse_file)
         browse_btn.pack(side="right", padx=(5, 0))
         
+        # Preview of the selected image
+        self.preview_label = ttk.Label(file_frame)
+        self.preview_label.pack(pady=5)
+        
         # Confidence threshold
         conf_frame = ttk.Frame(self.detection_frame)
         conf_frame.pack(pady=10, fill="x", padx=20)
@@ -137,24 +250,50 @@ class CigaretteDetectionGUI:
         conf_label = ttk.Label(conf_frame, text="0.5")
         conf_label.pack()
         
-        def update_conf_label(*args):
+        # Debounced: dragging fires the trace per pixel, the label only
+        # needs to settle once the slider pauses
+        self._conf_after_id = None
+        
+        def apply_conf_label():
+            self._conf_after_id = None
             conf_label.config(text=f"{self.confidence_var.get():.2f}")
+        
+        def update_conf_label(*args):
+            if self._conf_after_id is not None:
+                self.root.after_cancel(self._conf_after_id)
+            self._conf_after_id = self.root.after(50, apply_conf_label)
         self.confidence_var.trace("w", update_conf_label)
         
         # Analyze button
-        analyze_btn = ttk.Button(self.detection_frame, text="Analyze Image", command=self.analyze_image)
-        analyze_btn.pack(pady=20)
+        self.analyze_btn = ttk.Button(self.detection_frame, text="Analyze Image", command=self.analyze_image)
+        self.analyze_btn.pack(pady=20)
         
         # Results area
         results_frame = ttk.LabelFrame(self.detection_frame, text="Results")
         results_frame.pack(fill="both", expand=True, padx=20, pady=10)
         
-        # Results text
-        self.results_text = tk.Text(results_frame, height=10, wrap="word")
-        scrollbar = ttk.Scrollbar(results_frame, orient="vertical", command=self.results_text.yview)
-        self.results_text.configure(yscrollcommand=scrollbar.set)
-        
-        self.results_text.pack(side="left", fill="both", expand=True)
+        # Summary text; the per-object list goes in the tree below
+        self.results_text = tk.Text(results_frame, height=5, wrap="word")
+        self.results_text.tag_configure("alert", foreground="red", font=("Arial", 12, "bold"))
+        self.results_text.pack(side="top", fill="x")
+        
+        # Detections table; Treeview only lays out the visible rows
+        tree_frame = ttk.Frame(results_frame)
+        tree_frame.pack(side="top", fill="both", expand=True)
+        
+        self.results_tree = ttk.Treeview(tree_frame, columns=('idx', 'cls', 'conf', 'cig'), show='headings')
+        for column, heading, width in (
+            ('idx', '#', 40),
+            ('cls', 'Class', 200),
+            ('conf', 'Confidence', 100),
+            ('cig', 'Cigarette-related', 130),
+        ):
+            self.results_tree.heading(column, text=heading)
+            self.results_tree.column(column, width=width, stretch=(column == 'cls'))
+        scrollbar = ttk.Scrollbar(tree_frame, orient="vertical", command=self.results_tree.yview)
+        self.results_tree.configure(yscrollcommand=scrollbar.set)
+        
+        self.results_tree.pack(side="left", fill="both", expand=True)
         scrollbar.pack(side="right", fill="y")
     
     def setup_parental_tab(self):
@@ -179,7 +318,6 @@ class CigaretteDetectionGUI:
         device_frame = ttk.Frame(config_frame)
         device_frame.pack(fill="x", pady=5)
         ttk.Label(device_frame, text="Device ID:").pack(side="left")
-        self.device_id_var = tk.StringVar(value="desktop_device_001")
         device_entry = ttk.Entry(device_frame, textvariable=self.device_id_var, width=30)
         device_entry.pack(side="right")
         
@@ -226,8 +364,8 @@ class CigaretteDetectionGUI:
         self.stop_monitoring_btn.pack(side="left", padx=5)
         
         # Test report button
-        test_report_btn = ttk.Button(btn_frame, text="Send Test Report", command=self.send_test_report)
-        test_report_btn.pack(side="left", padx=5)
+        self.test_report_btn = ttk.Button(btn_frame, text="Send Test Report", command=self.send_test_report)
+        self.test_report_btn.pack(side="left", padx=5)
         
         # App Protection section
         protection_frame = ttk.LabelFrame(self.parental_frame, text="App Protection")
@@ -250,8 +388,12 @@ class CigaretteDetectionGUI:
         self.disable_protection_btn = ttk.Button(prot_btn_frame, text="Disable Protection", command=self.disable_protection, state="disabled")
         self.disable_protection_btn.pack(side="left", padx=5)
         
-        check_protection_btn = ttk.Button(prot_btn_frame, text="Check Status", command=self.check_protection_status)
-        check_protection_btn.pack(side="left", padx=5)
+        self.check_protection_btn = ttk.Button(prot_btn_frame, text="Check Status", command=self.check_protection_status)
+        self.check_protection_btn.pack(side="left", padx=5)
+        
+        # Protection status may have been polled before this tab was built
+        if self._last_protection:
+            self._render_protection(True)
     
     def setup_stats_tab(self):
         """Setup monitoring statistics tab"""
@@ -265,15 +407,10 @@ class CigaretteDetectionGUI:
         
         # Create stats labels
         self.stats_labels = {}
+        # (value label, formatter) pairs walked by _apply_stats on every poll
+        self._stats_bindings = []
         
-        stats_items = [
-            ("Total Videos Watched", "totalVideosWatched"),
-            ("Smoking Content Detected", "smokingContentDetected"),
-            ("Last Detection", "lastDetection"),
-            ("Detection Rate", "detectionRate")
-        ]
-        
-        for i, (label_text, key) in enumerate(stats_items):
+        for label_text, key, fmt in STATS_ITEMS:
             frame = ttk.Frame(stats_display_frame)
             frame.pack(fill="x", pady=5, padx=10)
             
@@ -282,18 +419,19 @@ class CigaretteDetectionGUI:
             value_label.pack(side="right")
             
             self.stats_labels[key] = value_label
+            self._stats_bindings.append((value_label, fmt))
         
         # Refresh button
-        refresh_btn = ttk.Button(self.stats_frame, text="Refresh Statistics", command=self.refresh_stats)
-        refresh_btn.pack(pady=10)
-        
-        # Auto-refresh
-        self.auto_refresh_stats()
+        self.refresh_btn = ttk.Button(self.stats_frame, text="Refresh Statistics", command=self.refresh_stats)
+        self.refresh_btn.pack(pady=10)
     
     def check_api_connection(self):
-        """Check if API server is running"""
+        """Probe the API health endpoint on the network loop"""
+        self._call('GET', 'health', self._on_health, timeout=5)
+    
+    def _on_health(self, future):
         try:
-            response = requests.get(f"{self.api_base_url}/health", timeout=5)
+            response = future.result()
             if response.status_code == 200:
                 self.status_var.set("Connected to API server")
             else:
@@ -312,6 +450,110 @@ class CigaretteDetectionGUI:
         )
         if file_path:
             self.file_path_var.set(file_path)
+            self.show_preview(file_path)
+    
+    def show_preview(self, file_path):
+        """Show a thumbnail of the selected image, reusing cached decodes"""
+        try:
+            st = os.stat(file_path)
+            photo = _load_thumbnail(file_path, st.st_mtime_ns, st.st_size, *PREVIEW_SIZE)
+        except OSError:
+            self.preview_label.config(image="")
+            return
+        self.preview_label.config(image=photo)
+    
+    def _submit(self, coro, on_done=None, dedupe_key=None, button=None):
+        """Schedule a coroutine on the network loop; on_done(future) runs on the Tk thread
+        
+        While a request with the same dedupe_key is still running, the new
+        coroutine is dropped and the running future is returned instead.
+        button, if given, is disabled until the request completes.
+        """
+        if dedupe_key is not None:
+            running = self._inflight.get(dedupe_key)
+            if running is not None and not running.done():
+                coro.close()
+                return running
+        
+        if button is not None:
+            button.config(state="disabled")
+        
+        future = asyncio.run_coroutine_threadsafe(coro, self._loop)
+        if dedupe_key is not None:
+            self._inflight[dedupe_key] = future
+        # Runs on the loop thread, so it only enqueues; Tk is never called from there
+        future.add_done_callback(
+            lambda f: self._completions.put((f, on_done, button, dedupe_key))
+        )
+        self._pending += 1
+        if self._poll_after_id is None:
+            self._poll_after_id = self.root.after(COMPLETION_POLL_MS, self._drain_completions)
+        return future
+    
+    def _drain_completions(self):
+        """Run the Tk-side completion of every finished request"""
+        self._poll_after_id = None
+        try:
+            while True:
+                try:
+                    future, on_done, button, dedupe_key = self._completions.get_nowait()
+                except queue.Empty:
+                    break
+                self._pending -= 1
+                if dedupe_key is not None and self._inflight.get(dedupe_key) is future:
+                    del self._inflight[dedupe_key]
+                self._finish(future, on_done, button)
+        finally:
+            if self._pending:
+                self._poll_after_id = self.root.after(COMPLETION_POLL_MS, self._drain_completions)
+    
+    def _finish(self, future, on_done, button):
+        # Re-enable first so on_done can still set the final button state
+        if button is not None:
+            button.config(state="normal")
+        if on_done is not None:
+            on_done(future)
+    
+    def _call(self, method, key, on_done, button=None, **kwargs):
+        """Submit a request to a named endpoint, collapsing identical in-flight calls"""
+        # Encode a JSON body once; the bytes double as part of the dedupe key
+        payload = kwargs.pop('json', None)
+        if payload is not None:
+            kwargs['data'] = _json_dumps(payload)
+            kwargs['headers'] = {'Content-Type': 'application/json'}
+        dedupe_key = (
+            method,
+            key,
+            _json_dumps(kwargs.get('params')),
+            kwargs.get('data'),
+        )
+        return self._submit(self._request(method, key, **kwargs), on_done, dedupe_key, button)
+    
+    async def _http(self, method, url, **kwargs):
+        """Issue a blocking HTTP request without blocking the loop"""
+        return await self._loop.run_in_executor(
+            None, functools.partial(self.http.request, method, url, **kwargs)
+        )
+    
+    def _request(self, method, key, **kwargs):
+        """Coroutine for a request to a named API endpoint (10 s default timeout)"""
+        kwargs.setdefault('timeout', 10)
+        return self._http(method, self._urls[key], **kwargs)
+    
+    def _reporting(self, action, on_success):
+        """Completion callback: on_success(response) on 200, otherwise an error dialog"""
+        def done(future):
+            try:
+                response = future.result()
+                
+                if response.status_code == 200:
+                    on_success(response)
+                else:
+                    messagebox.showerror("Error", f"Failed to {action}: {response.text}")
+                    
+            except Exception as e:
+                messagebox.showerror("Error", f"Failed to {action}: {str(e)}")
+        return done
     
     def analyze_image(self):
         """Analyze selected image"""
@@ -320,88 +562,120 @@ class CigaretteDetectionGUI:
             messagebox.showerror("Error", "Please select an image file")
             return
         
-        if not os.path.exists(file_path):
-            messagebox.showerror("Error", "Selected file does not exist")
-            return
-        
         self.status_var.set("Analyzing image...")
         self.results_text.delete(1.0, tk.END)
-        
-        def analyze():
-            try:
-                with open(file_path, 'rb') as f:
-                    files = {'file': f}
-                    data = {'confidence_threshold': self.confidence_var.get()}
-                    
-                    response = requests.post(
-                        f"{self.api_base_url}/detect/single",
-                        files=files,
-                        data=data,
-                        timeout=30
-                    )
-                
-                if response.status_code == 200:
-                    result = response.json()
-                    self.display_results(result)
-                    self.status_var.set("Analysis complete")
-                else:
-                    error_msg = f"API Error: {response.status_code}"
-                    self.results_text.insert(tk.END, error_msg)
-                    self.status_var.set("Analysis failed")
-                    
-            except requests.exceptions.RequestException as e:
-                error_msg = f"Connection Error: {str(e)}"
-                self.results_text.insert(tk.END, error_msg)
-                self.status_var.set("Connection failed")
-            except Exception as e:
-                error_msg = f"Error: {str(e)}"
+        self.results_tree.delete(*self.results_tree.get_children())
+        
+        # Run analysis on the network loop
+        confidence = self.confidence_var.get()
+        self._submit(
+            self._post_image(file_path, confidence),
+            self._on_analyze_done,
+            ('POST', 'analyze', file_path, confidence),
+            self.analyze_btn,
+        )
+    
+    async def _post_image(self, file_path, confidence):
+        # A missing file surfaces as FileNotFoundError from open()
+        with open(file_path, 'rb') as f:
+            boundary = uuid.uuid4().hex
+            body = self._multipart_stream(
+                boundary, f, os.path.basename(file_path),
+                {'confidence_threshold': confidence}
+            )
+            
+            return await self._request(
+                'POST',
+                'analyze',
+                data=body,
+                headers={'Content-Type': f'multipart/form-data; boundary={boundary}'},
+                timeout=30
+            )
+    
+    @staticmethod
+    def _multipart_stream(boundary, f, filename, fields):
+        """Yield a multipart/form-data body, reading the file in chunks
+        
+        Sent chunked, so the image is never held in memory as a whole.
+        """
+        for name, value in fields.items():
+            yield (
+                f'--{boundary}\r\n'
+                f'Content-Disposition: form-data; name="{name}"\r\n\r\n'
+                f'{value}\r\n'
+            ).encode()
+        
+        content_type = mimetypes.guess_type(filename)[0] or 'application/octet-stream'
+        yield (
+            f'--{boundary}\r\n'
+            f'Content-Disposition: form-data; name="file"; filename="{filename}"\r\n'
+            f'Content-Type: {content_type}\r\n\r\n'
+        ).encode()
+        for chunk in iter(lambda: f.read(UPLOAD_CHUNK_SIZE), b''):
+            yield chunk
+        yield f'\r\n--{boundary}--\r\n'.encode()
+    
+    def _on_analyze_done(self, future):
+        try:
+            response = future.result()
+            
+            if response.status_code == 200:
+                result = _json_loads(response.content)
+                self.display_results(result)
+                self.status_var.set("Analysis complete")
+            else:
+                error_msg = f"API Error: {response.status_code}"
                 self.results_text.insert(tk.END, error_msg)
                 self.status_var.set("Analysis failed")
-        
-        # Run analysis in background thread
-        threading.Thread(target=analyze, daemon=True).start()
+                
+        except FileNotFoundError:
+            self.results_text.insert(tk.END, "Selected file does not exist")
+            self.status_var.set("Analysis failed")
+        except requests.exceptions.RequestException as e:
+            error_msg = f"Connection Error: {str(e)}"
+            self.results_text.insert(tk.END, error_msg)
+            self.status_var.set("Connection failed")
+        except Exception as e:
+            error_msg = f"Error: {str(e)}"
+            self.results_text.insert(tk.END, error_msg)
+            self.status_var.set("Analysis failed")
     
     def display_results(self, result):
         """Display analysis results"""
-        self.results_text.delete(1.0, tk.END)
-        
         # Main result
         cigarette_detected = result.get('cigarette_detected', False)
         max_confidence = result.get('max_confidence', 0)
         
-        self.results_text.insert(tk.END, f"SMOKING DETECTION RESULTS (vaping devices and cigarettes)\n")
-        self.results_text.insert(tk.END, "=" * 40 + "\n\n")
+        # Collected as (text, tags) runs and inserted with one Tk call, so
+        # the widget lays out once instead of once per line
+        runs = [
+            "SMOKING DETECTION RESULTS (vaping devices and cigarettes)\n" + "=" * 40 + "\n", (),
+        ]
         
         if cigarette_detected:
-            self.results_text.insert(tk.END, "🚨 CIGARETTE DETECTED!\n", "alert")
-            self.results_text.insert(tk.END, f"Max Confidence: {max_confidence:.2f}\n\n")
+            runs += ["🚨 CIGARETTE DETECTED!\n", ("alert",)]
+            runs += [f"Max Confidence: {max_confidence:.2f}\n", ()]
         else:
-            self.results_text.insert(tk.END, "✅ No cigarette detected\n\n")
-        
-        # Detailed detections
-        detections = result.get('detections', [])
-        if detections:
-            self.results_text.insert(tk.END, f"Detailed Detections ({len(detections)} objects):\n")
-            self.results_text.insert(tk.END, "-" * 30 + "\n")
-            
-            for i, detection in enumerate(detections, 1):
-                class_name = detection.get('class', 'unknown')
-                confidence = detection.get('confidence', 0)
-                is_cigarette = detection.get('is_cigarette_related', False)
-                
-                line = f"{i}. {class_name} (confidence: {confidence:.2f})"
-                if is_cigarette:
-                    line += " [CIGARETTE-RELATED]"
-                line += "\n"
-                
-                self.results_text.insert(tk.END, line)
+            runs += ["✅ No cigarette detected\n", ()]
         
         # Analysis info
+        detections = result.get('detections', [])
         analysis_time = result.get('analysis_time', 0)
-        self.results_text.insert(tk.END, f"\nAnalysis Time: {analysis_time:.2f} seconds")
+        runs += [f"Detections: {len(detections)}    Analysis Time: {analysis_time:.2f} seconds", ()]
         
-        # Configure text tags for styling
-        self.results_text.tag_configure("alert", foreground="red", font=("Arial", 12, "bold"))
+        self.results_text.delete(1.0, tk.END)
+        self.results_text.insert(tk.END, *runs)
+        
+        # Detailed detections
+        tree = self.results_tree
+        tree.delete(*tree.get_children())
+        for i, detection in enumerate(detections, 1):
+            tree.insert('', 'end', values=(
+                i,
+                detection.get('class', 'unknown'),
+                f"{detection.get('confidence', 0):.2f}",
+                '✓' if detection.get('is_cigarette_related', False) else '',
+            ))
     
     def start_monitoring(self):
         """Start video monitoring"""
@@ -413,69 +687,57 @@ class CigaretteDetectionGUI:
             messagebox.showerror("Error", "Please enter device ID")
             return
         
-        def start():
-            try:
-                data = {
-                    "deviceId": device_id,
-                    "settings": {
-                        "realTimeAlerts": self.realtime_alerts_var.get(),
-                        "dailyReports": self.daily_reports_var.get(),
-                        "weeklyReports": False,
-                        "sensitivityLevel": self.sensitivity_var.get(),
-                        "monitoredApps": ["youtube", "tiktok", "instagram", "netflix"]
-                    }
-                }
+        data = {
+            "deviceId": device_id,
+            "settings": {
+                "realTimeAlerts": self.realtime_alerts_var.get(),
+                "dailyReports": self.daily_reports_var.get(),
+                "weeklyReports": False,
+                "sensitivityLevel": self.sensitivity_var.get(),
+                "monitoredApps": ["youtube", "tiktok", "instagram", "netflix"]
+            }
+        }
 
-                # Include parent email only if provided (optional for monitoring)
-                if parent_email:
-                    data["parentEmail"] = parent_email
-                
-                response = requests.post(
-                    f"{self.api_base_url}/parental-control/start-monitoring",
-                    json=data,
-                    timeout=10
-                )
-                
-                if response.status_code == 200:
-                    self.monitoring_active.set(True)
-                    self.monitoring_status_label.config(text="Active", foreground="green")
-                    self.start_monitoring_btn.config(state="disabled")
-                    self.stop_monitoring_btn.config(state="normal")
-                    self.status_var.set("Monitoring started successfully")
-                    messagebox.showinfo("Success", "Video monitoring started successfully!")
-                else:
-                    messagebox.showerror("Error", f"Failed to start monitoring: {response.text}")
-                    
-            except Exception as e:
-                messagebox.showerror("Error", f"Failed to start monitoring: {str(e)}")
-        
-        threading.Thread(target=start, daemon=True).start()
+        # Include parent email only if provided (optional for monitoring)
+        if parent_email:
+            data["parentEmail"] = parent_email
+        
+        self._call(
+            'POST', 'start_monitoring',
+            self._reporting("start monitoring", self._on_monitoring_started),
+            button=self.start_monitoring_btn,
+            json=data,
+        )
+    
+    def _on_monitoring_started(self, response):
+        self.root.after_idle(self._apply_monitoring_state, True)
+        self.status_var.set("Monitoring started successfully")
+        messagebox.showinfo("Success", "Video monitoring started successfully!")
     
     def stop_monitoring(self):
         """Stop video monitoring"""
-        def stop():
-            try:
-                device_id = self.device_id_var.get().strip()
-                response = requests.post(
-                    f"{self.api_base_url}/parental-control/stop-monitoring",
-                    params={"device_id": device_id},
-                    timeout=10
-                )
-                
-                if response.status_code == 200:
-                    self.monitoring_active.set(False)
-                    self.monitoring_status_label.config(text="Inactive", foreground="red")
-                    self.start_monitoring_btn.config(state="normal")
-                    self.stop_monitoring_btn.config(state="disabled")
-                    self.status_var.set("Monitoring stopped")
-                    messagebox.showinfo("Success", "Video monitoring stopped")
-                else:
-                    messagebox.showerror("Error", f"Failed to stop monitoring: {response.text}")
-                    
-            except Exception as e:
-                messagebox.showerror("Error", f"Failed to stop monitoring: {str(e)}")
-        
-        threading.Thread(target=stop, daemon=True).start()
+        device_id = self.device_id_var.get().strip()
+        self._call(
+            'POST', 'stop_monitoring',
+            self._reporting("stop monitoring", self._on_monitoring_stopped),
+            button=self.stop_monitoring_btn,
+            params={"device_id": device_id},
+        )
+    
+    def _on_monitoring_stopped(self, response):
+        self.root.after_idle(self._apply_monitoring_state, False)
+        self.status_var.set("Monitoring stopped")
+        messagebox.showinfo("Success", "Video monitoring stopped")
+    
+    def _apply_monitoring_state(self, active):
+        """Update every monitoring widget in one pass"""
+        self.monitoring_active.set(active)
+        self.monitoring_status_label.config(
+            text="Active" if active else "Inactive",
+            foreground="green" if active else "red",
+        )
+        self.start_monitoring_btn.config(state="disabled" if active else "normal")
+        self.stop_monitoring_btn.config(state="normal" if active else "disabled")
     
     def send_test_report(self):
         """Send test report to parent email"""
@@ -485,25 +747,17 @@ class CigaretteDetectionGUI:
             messagebox.showerror("Error", "Please enter parent email")
             return
         
-        def send():
-            try:
-                data = {"parentEmail": parent_email}
-                response = requests.post(
-                    f"{self.api_base_url}/parental-control/send-test-report",
-                    json=data,
-                    timeout=10
-                )
-                
-                if response.status_code == 200:
-                    messagebox.showinfo("Success", "Test report sent successfully!")
-                    self.status_var.set("Test report sent")
-                else:
-                    messagebox.showerror("Error", f"Failed to send test report: {response.text}")
-                    
-            except Exception as e:
-                messagebox.showerror("Error", f"Failed to send test report: {str(e)}")
-        
-        threading.Thread(target=send, daemon=True).start()
+        data = {"parentEmail": parent_email}
+        self._call(
+            'POST', 'test_report',
+            self._reporting("send test report", self._on_test_report_sent),
+            button=self.test_report_btn,
+            json=data,
+        )
+    
+    def _on_test_report_sent(self, response):
+        messagebox.showinfo("Success", "Test report sent successfully!")
+        self.status_var.set("Test report sent")
     
     def enable_protection(self):
         """Enable app protection"""
@@ -514,132 +768,170 @@ class CigaretteDetectionGUI:
             messagebox.showerror("Error", "Please enter parent email")
             return
         
-        def enable():
-            try:
-                data = {
-                    "parentEmail": parent_email,
-                    "deviceId": device_id
-                }
-                
-                response = requests.post(
-                    f"{self.api_base_url}/protection/enable",
-                    json=data,
-                    timeout=10
-                )
-                
-                if response.status_code == 200:
-                    self.protection_enabled.set(True)
-                    self.protection_status_label.config(text="Enabled", foreground="green")
-                    self.enable_protection_btn.config(state="disabled")
-                    self.disable_protection_btn.config(state="normal")
-                    self.status_var.set("App protection enabled")
-                    messagebox.showinfo("Success", "App protection enabled successfully!")
-                else:
-                    messagebox.showerror("Error", f"Failed to enable protection: {response.text}")
-                    
-            except Exception as e:
-                messagebox.showerror("Error", f"Failed to enable protection: {str(e)}")
-        
-        threading.Thread(target=enable, daemon=True).start()
+        data = {
+            "parentEmail": parent_email,
+            "deviceId": device_id
+        }
+        self._call(
+            'POST', 'protection_enable',
+            self._reporting("enable protection", self._on_protection_enabled),
+            button=self.enable_protection_btn,
+            json=data,
+        )
+    
+    def _on_protection_enabled(self, response):
+        self.root.after_idle(self._apply_protection, {'protected': True}, True)
+        self.status_var.set("App protection enabled")
+        messagebox.showinfo("Success", "App protection enabled successfully!")
     
     def disable_protection(self):
         """Disable app protection"""
-        def disable():
-            try:
-                response = requests.post(
-                    f"{self.api_base_url}/protection/disable",
-                    timeout=10
-                )
-                
-                if response.status_code == 200:
-                    self.protection_enabled.set(False)
-                    self.protection_status_label.config(text="Disabled", foreground="red")
-                    self.enable_protection_btn.config(state="normal")
-                    self.disable_protection_btn.config(state="disabled")
-                    self.status_var.set("App protection disabled")
-                    messagebox.showinfo("Success", "App protection disabled")
-                else:
-                    messagebox.showerror("Error", f"Failed to disable protection: {response.text}")
-                    
-            except Exception as e:
-                messagebox.showerror("Error", f"Failed to disable protection: {str(e)}")
-        
-        threading.Thread(target=disable, daemon=True).start()
+        self._call(
+            'POST', 'protection_disable',
+            self._reporting("disable protection", self._on_protection_disabled),
+            button=self.disable_protection_btn,
+        )
+    
+    def _on_protection_disabled(self, response):
+        self.root.after_idle(self._apply_protection, {'protected': False}, True)
+        self.status_var.set("App protection disabled")
+        messagebox.showinfo("Success", "App protection disabled")
     
     def check_protection_status(self):
         """Check app protection status"""
-        def check():
-            try:
-                device_id = self.device_id_var.get().strip()
-                response = requests.get(
-                    f"{self.api_base_url}/protection/status",
-                    params={"device_id": device_id},
-                    timeout=10
-                )
-                
-                if response.status_code == 200:
-                    status = response.json()
-                    protected = status.get('protected', False)
-                    
-                    if protected:
-                        self.protection_status_label.config(text="Enabled", foreground="green")
-                        self.enable_protection_btn.config(state="disabled")
-                        self.disable_protection_btn.config(state="normal")
-                    else:
-                        self.protection_status_label.config(text="Disabled", foreground="red")
-                        self.enable_protection_btn.config(state="normal")
-                        self.disable_protection_btn.config(state="disabled")
-                    
-                    self.status_var.set(f"Protection status: {status.get('status', 'unknown')}")
-                else:
-                    messagebox.showerror("Error", f"Failed to check protection status: {response.text}")
-                    
-            except Exception as e:
-                messagebox.showerror("Error", f"Failed to check protection status: {str(e)}")
-        
-        threading.Thread(target=check, daemon=True).start()
+        device_id = self.device_id_var.get().strip()
+        self._call(
+            'GET', 'protection_status',
+            self._reporting("check protection status", self._on_protection_status),
+            button=self.check_protection_btn,
+            params={"device_id": device_id},
+        )
+    
+    def _on_protection_status(self, response):
+        status = _json_loads(response.content)
+        self.root.after_idle(self._apply_protection, status)
+        self.status_var.set(f"Protection status: {status.get('status', 'unknown')}")
     
     def refresh_stats(self):
         """Refresh monitoring statistics"""
-        def refresh():
-            try:
-                device_id = self.device_id_var.get().strip()
-                response = requests.get(
-                    f"{self.api_base_url}/parental-control/stats",
-                    params={"device_id": device_id},
-                    timeout=10
-                )
+        device_id = self.device_id_var.get().strip()
+        self._call(
+            'GET', 'stats',
+            self._on_stats,
+            button=self.refresh_btn,
+            params={"device_id": device_id},
+        )
+    
+    def _on_stats(self, future):
+        try:
+            response = future.result()
+            
+            if response.status_code == 200:
+                stats = _json_loads(response.content)
+                self._apply_stats(stats)
+                self.status_var.set("Statistics updated")
+            else:
+                self.status_var.set("Failed to get statistics")
                 
-                if response.status_code == 200:
-                    stats = response.json()
-                    
-                    # Update stats labels
-                    self.stats_labels["totalVideosWatched"].config(text=str(stats.get("totalVideosWatched", 0)))
-                    self.stats_labels["smokingContentDetected"].config(text=str(stats.get("smokingContentDetected", 0)))
-                    self.stats_labels["lastDetection"].config(text=stats.get("lastDetection", "Never") or "Never")
-                    
-                    # Calculate detection rate
-                    total = stats.get("totalVideosWatched", 0)
-                    detected = stats.get("smokingContentDetected", 0)
-                    rate = (detected / total * 100) if total > 0 else 0
-                    self.stats_labels["detectionRate"].config(text=f"{rate:.1f}%")
-                    
-                    self.status_var.set("Statistics updated")
-                else:
-                    self.status_var.set("Failed to get statistics")
-                    
-            except Exception as e:
-                self.status_var.set(f"Stats error: {str(e)}")
+        except Exception as e:
+            self.status_var.set(f"Stats error: {str(e)}")
+    
+    def _fetch_status(self):
+        """Fetch health, stats and protection status with one /status call"""
+        # The server has no notion of the GUI's device, so always name it
+        device_id = self.device_id_var.get().strip() or DEFAULT_DEVICE_ID
+        self._call(
+            'GET', 'status',
+            self._on_status,
+            params={"device_id": device_id},
+        )
+    
+    def _on_status(self, future):
+        try:
+            response = future.result()
+            
+            if response.status_code == 200:
+                payload = _json_loads(response.content)
+                self._apply_protection(payload["protection"])
+                self._apply_stats(payload["stats"])
+                self._apply_health(payload["health"])
+            else:
+                self.status_var.set("Failed to get statistics")
+                
+        except Exception as e:
+            self.status_var.set(f"Stats error: {str(e)}")
+    
+    def _apply_stats(self, stats):
+        if self.stats_labels is None:
+            return
+        
+        texts = tuple(fmt(stats) for _, fmt in self._stats_bindings)
+        if texts == self._last_stats:
+            return
+        self._last_stats = texts
         
-        threading.Thread(target=refresh, daemon=True).start()
+        # Update stats labels
+        for (label, _), text in zip(self._stats_bindings, texts):
+            label.config(text=text)
+    
+    def _apply_health(self, health):
+        status = health.get("status", "unknown")
+        if status == "healthy":
+            self.status_var.set("Connected to API server - statistics updated")
+        else:
+            self.status_var.set(f"API server {status} - statistics updated")
+    
+    def _apply_protection(self, status, force=False):
+        """Render protection state; polls skip unchanged values, user actions pass force
+        
+        force re-renders anyway because _finish has just re-enabled the
+        action button, which may not match the cached state.
+        """
+        protected = bool(status.get('protected', False))
+        if protected == self._last_protection and not force:
+            return
+        self._last_protection = protected
+        self.protection_enabled.set(protected)
+        if self.protection_status_label is not None:
+            self._render_protection(protected)
+    
+    def _render_protection(self, protected):
+        if protected:
+            self.protection_status_label.config(text="Enabled", foreground="green")
+            self.enable_protection_btn.config(state="disabled")
+            self.disable_protection_btn.config(state="normal")
+        else:
+            self.protection_status_label.config(text="Disabled", foreground="red")
+            self.enable_protection_btn.config(state="normal")
+            self.disable_protection_btn.config(state="disabled")
     
     def auto_refresh_stats(self):
-        """Auto-refresh statistics every 30 seconds"""
-        self.refresh_stats()
-        self.root.after(30000, self.auto_refresh_stats)  # 30 seconds
+        """Auto-refresh statistics every 30 seconds while the stats tab is visible"""
+        self._stats_after_id = None
+        if self.notebook.select() == str(self.stats_frame):
+            self._fetch_status()
+            self._stats_after_id = self.root.after(30000, self.auto_refresh_stats)  # 30 seconds
+    
+    def _build_selected_tab(self):
+        """Build the selected tab's widgets if this is the first time it is shown"""
+        name, setup = self._tab_setup[self.notebook.select()]
+        if not self._tab_built[name]:
+            self._tab_built[name] = True
+            setup()
+    
+    def _on_tab_change(self, event=None):
+        """Refresh immediately when the stats tab is shown; stop polling when it is hidden"""
+        self._build_selected_tab()
+        if self.notebook.select() == str(self.stats_frame):
+            if self._stats_after_id is None:
+                self.auto_refresh_stats()
+        elif self._stats_after_id is not None:
+            self.root.after_cancel(self._stats_after_id)
+            self._stats_after_id = None
 
 def main():
     """Main function"""
+    logging.basicConfig(level=os.environ.get('ESC_LOG_LEVEL', 'WARNING').upper())
     root = tk.Tk()
     app = CigaretteDetectionGUI(root)
     root.mainloop()
@@ -11,13 +11,48 @@ import sys
 import argparse
 import time
 import json
+import threading
+import itertools
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 import subprocess
 import sqlite3
 from datetime import datetime
 
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# Network input size (width, height) and the pixel scale the network applies to
+# the uint8 input blob (passed to setInput rather than baked into a float blob)
+INPUT_SIZE = (416, 416)
+BLOB_SCALE = 0.00392
+
+# Darknet (config, weights) per model variant; tiny trades accuracy for much faster CPU inference
+MODEL_FILES = {
+    "full": ("yolov4.cfg", "yolov4.weights"),
+    "tiny": ("yolov4-tiny.cfg", "yolov4-tiny.weights"),
+}
+
+# Class-name fragments that mark a detection as a smoking or vaping object outright
+SMOKING_OBJECTS = ('cigarette', 'cigar', 'pipe', 'lighter', 'ashtray')
+VAPING_OBJECTS = ('vape', 'e-cigarette', 'vaporizer', 'mod', 'pod', 'juul')
+
+# Images whose detection rows are buffered before one executemany into the batch results database
+DB_FLUSH_IMAGES = 100
+
+# Batches decoded ahead of, and awaiting postprocessing behind, the network in analyze_paths
+PIPELINE_DEPTH = 4
+
+# File suffixes picked up by the photo library scan and the --batch directory scan
+PHOTO_EXTENSIONS = frozenset({'.jpg', '.jpeg', '.png', '.heic', '.tiff'})
+IMAGE_EXTENSIONS = frozenset({'.jpg', '.jpeg', '.png', '.bmp', '.tiff'})
+
 class SmokingVapingDetector:
-    def __init__(self, model_dir="models"):
+    def __init__(self, model_dir="models", use_gpu="auto", precision="fp32", model="full",
+                 use_gesture_heuristic=False):
         # Resolve model directory for normal runs, PyInstaller, and py2app bundles
         if not os.path.isabs(model_dir):
             base_dir = os.path.dirname(os.path.abspath(__file__))
@@ -41,13 +76,41 @@ class SmokingVapingDetector:
         else:
             self.model_dir = model_dir
         
-        self.config_path = os.path.join(self.model_dir, "yolov4.cfg")
-        self.weights_path = os.path.join(self.model_dir, "yolov4.weights")
+        if model not in MODEL_FILES:
+            raise ValueError(f"Unsupported model: {model}")
+        self.model = model
+        config_file, weights_file = MODEL_FILES[model]
+        self.config_path = os.path.join(self.model_dir, config_file)
+        self.weights_path = os.path.join(self.model_dir, weights_file)
         self.classes_path = os.path.join(self.model_dir, "coco.names")
         
         self.net = None
         self.classes = []
         self.output_layers = []
+        # Derived from self.classes at load time (see _index_classes)
+        self._direct_types = {}
+        self._person_id = None
+        
+        # use_gpu: True asks for the OpenCV CUDA backend, False keeps the CPU,
+        # "auto" uses CUDA whenever a device is present. self.use_gpu reports
+        # whether CUDA is actually in use once the model is loaded.
+        self._gpu_requested = use_gpu
+        self.use_gpu = False
+        # 'fp16' uses half precision on the GPU (tensor cores on Volta and newer)
+        if precision not in ("fp32", "fp16"):
+            raise ValueError(f"Unsupported precision: {precision}")
+        self.precision = precision
+        
+        # The Canny/contour gesture check on person crops costs a full edge pass
+        # per person and mostly reacts to noise, so it is opt-in
+        self.use_gesture_heuristic = use_gesture_heuristic
+        
+        # A cv2.dnn.Net is not safe to run concurrently, so callers analyzing
+        # images from worker threads share the network through this lock
+        self._net_lock = threading.Lock()
+        
+        # Per-thread preprocessing buffers reused across calls (see _blob_from_images)
+        self._buffers = threading.local()
         
         # Smoking and vaping related keywords for enhanced detection
         self.smoking_keywords = [
@@ -65,20 +128,20 @@ class SmokingVapingDetector:
         try:
             if not os.path.exists(self.config_path):
                 print(f"Config file not found: {self.config_path}")
-                print("Please run 'python setup_models.py' to download required files")
+                print(f"Please run '{self._setup_command()}' to download required files")
                 return False
             
             if not os.path.exists(self.weights_path):
                 print(f"Weights file not found: {self.weights_path}")
-                print("Please run 'python setup_models.py' to download required files")
+                print(f"Please run '{self._setup_command()}' to download required files")
                 return False
             
             # Load YOLO
             self.net = cv2.dnn.readNet(self.weights_path, self.config_path)
+            self._configure_backend()
             
-            # Get output layer names
-            layer_names = self.net.getLayerNames()
-            self.output_layers = [layer_names[i - 1] for i in self.net.getUnconnectedOutLayers()]
+            # Get output layer names (works whatever shape getUnconnectedOutLayers() returns)
+            self.output_layers = tuple(self.net.getUnconnectedOutLayersNames())
             
             # Load class names
             if os.path.exists(self.classes_path):
@@ -101,15 +164,86 @@ class SmokingVapingDetector:
                     "toothbrush"
                 ]
             
-            print("YOLOv4 model loaded successfully")
+            self._index_classes()
+            self._warmup()
+            
+            print(f"YOLOv4 model loaded successfully ({self.model})")
             return True
             
         except Exception as e:
             print(f"Error loading model: {e}")
             return False
     
-    def analyze_image(self, image_path, confidence_threshold=0.5):
-        """Analyze image for smoking and vaping detection"""
+    def _index_classes(self):
+        """Resolve the class-name keyword checks to class ids once per model load"""
+        self._direct_types = {}
+        for class_id, name in enumerate(self.classes):
+            name = name.lower()
+            if any(obj in name for obj in SMOKING_OBJECTS):
+                self._direct_types[class_id] = 'smoking'
+            elif any(obj in name for obj in VAPING_OBJECTS):
+                self._direct_types[class_id] = 'vaping'
+        self._person_id = self.classes.index("person") if "person" in self.classes else None
+    
+    def _setup_command(self):
+        """Command that downloads this model's files"""
+        return "python setup_models.py --tiny" if self.model == "tiny" else "python setup_models.py"
+    
+    def _warmup(self):
+        """Run one dummy forward pass so OpenCV's lazy backend setup happens at load
+        
+        Without it the first analyzed image pays the initialization cost and
+        reports it as analysis_time.
+        """
+        blob = np.zeros((1, 3, INPUT_SIZE[1], INPUT_SIZE[0]), dtype=np.uint8)
+        with self._net_lock:
+            self.net.setInput(blob, "", BLOB_SCALE)
+            self.net.forward(self.output_layers)
+    
+    def _configure_backend(self):
+        """Select the CUDA backend if requested and available, else stay on CPU"""
+        if not self._gpu_requested:
+            return
+        
+        if self._cuda_device_count() == 0:
+            if self._gpu_requested != "auto":
+                print("No CUDA device available, running detection on CPU")
+            return
+        
+        self.use_gpu = True
+        self.net.setPreferableBackend(cv2.dnn.DNN_BACKEND_CUDA)
+        if self.precision == "fp16":
+            major = self._cuda_compute_major()
+            if major is not None and major < 7:
+                # Pascal and older have no tensor cores and slow half-precision math
+                print(f"Warning: FP16 is slow on compute capability {major}.x GPUs, consider fp32")
+            self.net.setPreferableTarget(cv2.dnn.DNN_TARGET_CUDA_FP16)
+        else:
+            self.net.setPreferableTarget(cv2.dnn.DNN_TARGET_CUDA)
+        print(f"Using OpenCV CUDA backend ({self.precision})")
+    
+    @staticmethod
+    def _cuda_device_count():
+        """Number of CUDA devices OpenCV can use (0 for builds without CUDA)"""
+        try:
+            return cv2.cuda.getCudaEnabledDeviceCount()
+        except (AttributeError, cv2.error):
+            return 0
+    
+    @staticmethod
+    def _cuda_compute_major():
+        """Compute capability major version of the current CUDA device, if known"""
+        try:
+            return cv2.cuda.DeviceInfo(cv2.cuda.getDevice()).majorVersion()
+        except (AttributeError, cv2.error):
+            return None
+    
+    def analyze_image(self, image_path, confidence_threshold=0.5, keep_image=False):
+        """Analyze image for smoking and vaping detection
+        
+        With keep_image the decoded frame is stored as result["_image"] so
+        save_detection_result can annotate it without decoding the file again.
+        """
         try:
             if self.net is None:
                 return None, "Model not loaded"
@@ -119,104 +253,233 @@ class SmokingVapingDetector:
             if image is None:
                 return None, f"Could not load image: {image_path}"
             
-            height, width, channels = image.shape
+            result, error = self._analyze_frame(image, image_path, confidence_threshold)
+            if keep_image and result is not None:
+                result["_image"] = image
+            return result, error
             
+        except Exception as e:
+            return None, f"Detection error: {str(e)}"
+    
+    def analyze_image_bytes(self, data, confidence_threshold=0.5, image_name=None):
+        """Analyze an encoded image held in memory (e.g. an upload) without touching disk"""
+        try:
+            if self.net is None:
+                return None, "Model not loaded"
+            
+            image = cv2.imdecode(np.frombuffer(data, np.uint8), cv2.IMREAD_COLOR)
+            if image is None:
+                return None, f"Could not decode image: {image_name or '<bytes>'}"
+            
+            return self._analyze_frame(image, image_name, confidence_threshold)
+            
+        except Exception as e:
+            return None, f"Detection error: {str(e)}"
+    
+    def _analyze_frame(self, image, image_path, confidence_threshold):
+        """Run detection on a decoded BGR frame"""
+        try:
             # Prepare image for YOLO
-            blob = cv2.dnn.blobFromImage(image, 0.00392, (416, 416), (0, 0, 0), True, crop=False)
-            self.net.setInput(blob)
+            blob = self._blob_from_images((image,))
             
             # Run detection
-            start_time = time.time()
-            outputs = self.net.forward(self.output_layers)
-            analysis_time = time.time() - start_time
-            
-            # Process detections
-            boxes = []
-            confidences = []
-            class_ids = []
-            
-            for output in outputs:
-                for detection in output:
-                    scores = detection[5:]
-                    class_id = np.argmax(scores)
-                    confidence = scores[class_id]
-                    
-                    if confidence > confidence_threshold:
-                        # Object detected
-                        center_x = int(detection[0] * width)
-                        center_y = int(detection[1] * height)
-                        w = int(detection[2] * width)
-                        h = int(detection[3] * height)
-                        
-                        # Rectangle coordinates
-                        x = int(center_x - w / 2)
-                        y = int(center_y - h / 2)
-                        
-                        boxes.append([x, y, w, h])
-                        confidences.append(float(confidence))
-                        class_ids.append(class_id)
-            
-            # Apply non-maximum suppression
-            indexes = cv2.dnn.NMSBoxes(boxes, confidences, confidence_threshold, 0.4)
-            
-            # Analyze detections for smoking/vaping-related objects
-            detections = []
-            smoking_detected = False
-            vaping_detected = False
-            cigarette_detected = False  # Keep for backward compatibility
-            max_confidence = 0.0
-            detection_types = []
-            
-            if len(indexes) > 0:
-                for i in indexes.flatten():
-                    x, y, w, h = boxes[i]
-                    confidence = confidences[i]
-                    class_id = class_ids[i]
-                    
-                    class_name = self.classes[class_id] if class_id < len(self.classes) else "unknown"
-                    
-                    # Check if detection is smoking/vaping-related
-                    detection_result = self._is_smoking_vaping_related(class_name, confidence, image, x, y, w, h)
-                    
-                    if detection_result['is_related']:
-                        if detection_result['type'] == 'smoking':
-                            smoking_detected = True
-                            cigarette_detected = True  # Backward compatibility
-                        elif detection_result['type'] == 'vaping':
-                            vaping_detected = True
-                        
-                        max_confidence = max(max_confidence, confidence)
-                        detection_types.append(detection_result['type'])
-                    
-                    detections.append({
-                        "class": class_name,
-                        "confidence": confidence,
-                        "bbox": [x, y, w, h],
-                        "is_cigarette_related": detection_result['is_related'],
-                        "detection_type": detection_result['type'],
-                        "reasoning": detection_result['reasoning']
-                    })
-            
-            # Enhanced result with both smoking and vaping detection
-            result = {
-                "cigarette_detected": cigarette_detected,  # Keep for backward compatibility
-                "smoking_detected": smoking_detected,
-                "vaping_detected": vaping_detected,
-                "any_detected": smoking_detected or vaping_detected,
-                "detection_types": list(set(detection_types)),
-                "total_detections": len([d for d in detections if d["is_cigarette_related"]]),
-                "max_confidence": max_confidence,
-                "analysis_time": analysis_time,
-                "detections": detections,
-                "image_path": image_path
-            }
+            with self._net_lock:
+                self.net.setInput(blob, "", BLOB_SCALE)
+                start_time = time.time()
+                outputs = self.net.forward(self.output_layers)
+                analysis_time = time.time() - start_time
             
-            return result, None
+            return self._postprocess(image, image_path, outputs, confidence_threshold, analysis_time)
             
         except Exception as e:
             return None, f"Detection error: {str(e)}"
+    
+    def analyze_batch(self, image_paths, confidence_threshold=0.5):
+        """Analyze several images with one batched forward pass.
+        
+        Returns a (result, error) pair for each path, in the same order.
+        """
+        if self.net is None:
+            return [(None, "Model not loaded")] * len(image_paths)
+        
+        loaded = self._load_batch(image_paths)
+        return self._finish_batch(image_paths, loaded, self._infer_batch(loaded[1]), confidence_threshold)
+    
+    def _load_batch(self, image_paths):
+        """Decode a batch; returns (outcomes, images, positions) with load errors filled in"""
+        outcomes = [None] * len(image_paths)
+        images = []
+        positions = []
+        
+        for i, image_path in enumerate(image_paths):
+            image = cv2.imread(image_path)
+            if image is None:
+                outcomes[i] = (None, f"Could not load image: {image_path}")
+            else:
+                images.append(image)
+                positions.append(i)
+        
+        return outcomes, images, positions
+    
+    def _infer_batch(self, images):
+        """Run one forward pass over decoded images; returns (outputs, per-image time, error)"""
+        if not images:
+            return None, 0.0, None
+        
+        try:
+            blob = self._blob_from_images(images)
+            
+            with self._net_lock:
+                self.net.setInput(blob, "", BLOB_SCALE)
+                start_time = time.time()
+                batch_outputs = self.net.forward(self.output_layers)
+                analysis_time = (time.time() - start_time) / len(images)
+        except Exception as e:
+            return None, 0.0, f"Detection error: {str(e)}"
+        
+        return batch_outputs, analysis_time, None
+    
+    def _finish_batch(self, image_paths, loaded, inferred, confidence_threshold):
+        """Postprocess a batch's network outputs into (result, error) pairs"""
+        outcomes, images, positions = loaded
+        batch_outputs, analysis_time, error = inferred
+        
+        if error is not None:
+            for i in positions:
+                outcomes[i] = (None, error)
+            return outcomes
+        
+        for n, (i, image) in enumerate(zip(positions, images)):
+            try:
+                outputs = [self._batch_item(output, n, len(images)) for output in batch_outputs]
+                outcomes[i] = self._postprocess(
+                    image, image_paths[i], outputs, confidence_threshold, analysis_time
+                )
+            except Exception as e:
+                outcomes[i] = (None, f"Detection error: {str(e)}")
+        
+        return outcomes
+    
+    def _blob_from_images(self, images):
+        """Equivalent of blobFromImages(images, 1.0, INPUT_SIZE, swapRB=True, ddepth=CV_8U)
+        
+        The blob stays uint8 (a quarter of the float32 size to copy to the
+        backend); BLOB_SCALE is applied by setInput. Writes into a buffer
+        owned by the calling thread instead of allocating a new blob per
+        call; the buffer only grows when a larger batch arrives. The returned
+        array is overwritten by this thread's next call.
+        """
+        buffers = self._buffers
+        width, height = INPUT_SIZE
+        
+        blob = getattr(buffers, "blob", None)
+        if blob is None or len(blob) < len(images):
+            blob = buffers.blob = np.empty((len(images), 3, height, width), dtype=np.uint8)
+            buffers.resized = np.empty((height, width, 3), dtype=np.uint8)
+        resized = buffers.resized
+        
+        for n, image in enumerate(images):
+            cv2.resize(image, INPUT_SIZE, dst=resized)
+            # HWC BGR -> CHW RGB
+            blob[n] = resized.transpose(2, 0, 1)[::-1]
+        
+        return blob[:len(images)]
+    
+    @staticmethod
+    def _batch_item(output, index, batch_size):
+        """Select one image's rows from a batched YOLO output layer"""
+        if output.ndim == 3:
+            return output[index]
+        return output.reshape(batch_size, -1, output.shape[-1])[index]
+    
+    def _postprocess(self, image, image_path, outputs, confidence_threshold, analysis_time):
+        """Turn raw YOLO output layers for one image into a detection result"""
+        height, width = image.shape[:2]
+        
+        # Threshold each output layer on its best class score first, so only
+        # the few surviving rows are copied and need an argmax
+        kept_rows = []
+        kept_confidences = []
+        for output in outputs:
+            output = output.reshape(-1, output.shape[-1])
+            best = output[:, 5:].max(axis=1)
+            keep = best > confidence_threshold
+            kept_rows.append(output[keep])
+            kept_confidences.append(best[keep])
+        rows = np.concatenate(kept_rows)
+        
+        # Object detected: centre/size to rectangle coordinates, truncated like int()
+        center_x = (rows[:, 0] * width).astype(np.int32)
+        center_y = (rows[:, 1] * height).astype(np.int32)
+        w = (rows[:, 2] * width).astype(np.int32)
+        h = (rows[:, 3] * height).astype(np.int32)
+        x = (center_x - w / 2).astype(np.int32)
+        y = (center_y - h / 2).astype(np.int32)
+        
+        # Candidates stay as contiguous arrays; only NMS needs Python lists
+        boxes = np.stack([x, y, w, h], axis=1)
+        confidences = np.concatenate(kept_confidences).astype(np.float32)
+        class_ids = rows[:, 5:].argmax(axis=1).astype(np.int32)
+        
+        # Apply non-maximum suppression
+        indexes = cv2.dnn.NMSBoxes(boxes.tolist(), confidences.tolist(), confidence_threshold, 0.4)
+        
+        # Analyze detections for smoking/vaping-related objects
+        detections = []
+        smoking_detected = False
+        vaping_detected = False
+        cigarette_detected = False  # Keep for backward compatibility
+        max_confidence = 0.0
+        detection_types = []
+        
+        if len(indexes) > 0:
+            # Gather the survivors once, converted back to plain Python numbers
+            kept = np.asarray(indexes).flatten()
+            for (x, y, w, h), confidence, class_id in zip(
+                boxes[kept].tolist(), confidences[kept].tolist(), class_ids[kept].tolist()
+            ):
+                class_name = self.classes[class_id] if class_id < len(self.classes) else "unknown"
+                
+                # Check if detection is smoking/vaping-related
+                detection_result = self._is_smoking_vaping_related(class_id, class_name, confidence, image, x, y, w, h)
+                
+                if detection_result['is_related']:
+                    if detection_result['type'] == 'smoking':
+                        smoking_detected = True
+                        cigarette_detected = True  # Backward compatibility
+                    elif detection_result['type'] == 'vaping':
+                        vaping_detected = True
+                    
+                    max_confidence = max(max_confidence, confidence)
+                    detection_types.append(detection_result['type'])
+                
+                detections.append({
+                    "class": class_name,
+                    "confidence": confidence,
+                    "bbox": [x, y, w, h],
+                    "is_cigarette_related": detection_result['is_related'],
+                    "detection_type": detection_result['type'],
+                    "reasoning": detection_result['reasoning']
+                })
+        
+        # Enhanced result with both smoking and vaping detection
+        result = {
+            "cigarette_detected": cigarette_detected,  # Keep for backward compatibility
+            "smoking_detected": smoking_detected,
+            "vaping_detected": vaping_detected,
+            "any_detected": smoking_detected or vaping_detected,
+            "detection_types": list(set(detection_types)),
+            "total_detections": len([d for d in detections if d["is_cigarette_related"]]),
+            "max_confidence": max_confidence,
+            "analysis_time": analysis_time,
+            "detections": detections,
+            "image_path": image_path
+        }
+        
+        return result, None
 
-    def _is_smoking_vaping_related(self, class_name, confidence, image, x, y, w, h):
+
+    def _is_smoking_vaping_related(self, class_id, class_name, confidence, image, x, y, w, h):
         """Enhanced detection for both smoking and vaping"""
         result = {
             'is_related': False,
@@ -225,46 +488,36 @@ class SmokingVapingDetector:
             'reasoning': []
         }
         
-        # Direct object detection (if we had specialized models)
-        smoking_objects = ['cigarette', 'cigar', 'pipe', 'lighter', 'ashtray']
-        vaping_objects = ['vape', 'e-cigarette', 'vaporizer', 'mod', 'pod', 'juul']
-        
-        class_lower = class_name.lower()
-        
-        # Check for direct smoking objects
-        if any(obj in class_lower for obj in smoking_objects):
-            result['is_related'] = True
-            result['type'] = 'smoking'
-            result['reasoning'].append(f"Direct smoking object detected: {class_name}")
-            return result
-        
-        # Check for direct vaping objects
-        if any(obj in class_lower for obj in vaping_objects):
+        # Direct object detection (if we had specialized models); the
+        # SMOKING_OBJECTS / VAPING_OBJECTS name checks ran once at load time
+        direct_type = self._direct_types.get(class_id)
+        if direct_type is not None:
             result['is_related'] = True
-            result['type'] = 'vaping'
-            result['reasoning'].append(f"Direct vaping object detected: {class_name}")
+            result['type'] = direct_type
+            result['reasoning'].append(f"Direct {direct_type} object detected: {class_name}")
             return result
         
         # Enhanced person detection with context analysis
-        if class_name == "person" and confidence > 0.6:
-            # Extract person region for additional analysis
+        if class_id == self._person_id and confidence > 0.6:
             try:
-                person_region = image[y:y+h, x:x+w]
-                
-                # Analyze hand/mouth regions for smoking/vaping gestures
-                gesture_analysis = self._analyze_smoking_vaping_gesture(person_region)
-                
-                if gesture_analysis['smoking_gesture']:
-                    result['is_related'] = True
-                    result['type'] = 'smoking'
-                    result['reasoning'].append("Person with potential smoking gesture detected")
-                    return result
-                
-                if gesture_analysis['vaping_gesture']:
-                    result['is_related'] = True
-                    result['type'] = 'vaping'
-                    result['reasoning'].append("Person with potential vaping gesture detected")
-                    return result
+                if self.use_gesture_heuristic:
+                    # Extract person region for additional analysis
+                    person_region = image[y:y+h, x:x+w]
+                    
+                    # Analyze hand/mouth regions for smoking/vaping gestures
+                    gesture_analysis = self._analyze_smoking_vaping_gesture(person_region)
+                    
+                    if gesture_analysis['smoking_gesture']:
+                        result['is_related'] = True
+                        result['type'] = 'smoking'
+                        result['reasoning'].append("Person with potential smoking gesture detected")
+                        return result
+                    
+                    if gesture_analysis['vaping_gesture']:
+                        result['is_related'] = True
+                        result['type'] = 'vaping'
+                        result['reasoning'].append("Person with potential vaping gesture detected")
+                        return result
                 
                 # High confidence person detection (fallback) - assume smoking for now
                 if confidence > 0.8:
@@ -324,18 +577,13 @@ class SmokingVapingDetector:
         
         return result
     
-    def _is_cigarette_related(self, class_name, confidence):
+    def _is_cigarette_related(self, class_id, confidence):
         """Determine if detected object is cigarette-related"""
         # This is a simplified heuristic - in production you'd use a specialized model
-        cigarette_keywords = [
-            "person",  # People smoking
-            "bottle",  # Could be lighter fluid, etc.
-            "cup",     # Ashtrays, etc.
-        ]
         
         # For demo purposes, we'll consider high-confidence person detections
         # as potentially cigarette-related (would need specialized training)
-        if class_name == "person" and confidence > 0.7:
+        if class_id == self._person_id and confidence > 0.7:
             return True
         
         # In a real implementation, you would:
@@ -351,23 +599,14 @@ class SmokingVapingDetector:
             # This is a simplified implementation
             # In production, you'd use proper Apple Photos API integration
             
-            photos_dir = os.path.expanduser("~/Pictures")
-            photo_extensions = ['.jpg', '.jpeg', '.png', '.heic', '.tiff']
+            photos_dir = Path(os.path.expanduser("~/Pictures"))
             
-            photos = []
-            
-            for root, dirs, files in os.walk(photos_dir):
-                for file in files:
-                    if any(file.lower().endswith(ext) for ext in photo_extensions):
-                        photos.append(os.path.join(root, file))
-                        
-                        if len(photos) >= limit:
-                            break
-                
-                if len(photos) >= limit:
-                    break
-            
-            return photos[:limit]
+            # Lazy walk that stops as soon as limit photos are found
+            photos = (
+                str(path) for path in photos_dir.rglob('*')
+                if path.suffix.lower() in PHOTO_EXTENSIONS and path.is_file()
+            )
+            return list(itertools.islice(photos, limit))
             
         except Exception as e:
             print(f"Error accessing photos: {e}")
@@ -379,25 +618,35 @@ class SmokingVapingDetector:
             if not result or "image_path" not in result:
                 return False
             
-            # Load original image
-            image = cv2.imread(result["image_path"])
+            # Reuse the frame decoded during analysis when it was kept
+            image = result.get("_image")
+            if image is None:
+                image = cv2.imread(result["image_path"])
             if image is None:
                 return False
             
-            # Draw detections
-            for detection in result["detections"]:
+            detections = result["detections"]
+            
+            # Draw bounding boxes, one polylines call per color
+            for is_cigarette in (False, True):
+                color = (0, 0, 255) if is_cigarette else (0, 255, 0)  # Red for cigarette, green for other
+                bboxes = np.array(
+                    [d["bbox"] for d in detections if d["is_cigarette_related"] == is_cigarette],
+                    dtype=np.int32,
+                ).reshape(-1, 4)
+                if len(bboxes):
+                    x, y, w, h = bboxes.T
+                    corners = np.stack([x, y, x + w, y, x + w, y + h, x, y + h], axis=1).reshape(-1, 4, 2)
+                    cv2.polylines(image, corners, True, color, 2)
+            
+            # Draw labels
+            for detection in detections:
                 x, y, w, h = detection["bbox"]
                 confidence = detection["confidence"]
                 class_name = detection["class"]
                 is_cigarette = detection["is_cigarette_related"]
+                color = (0, 0, 255) if is_cigarette else (0, 255, 0)
                 
-                # Choose color based on cigarette detection
-                color = (0, 0, 255) if is_cigarette else (0, 255, 0)  # Red for cigarette, green for other
-                
-                # Draw bounding box
-                cv2.rectangle(image, (x, y), (x + w, y + h), color, 2)
-                
-                # Draw label
                 label = f"{class_name}: {confidence:.2f}"
                 if is_cigarette:
                     label += " (CIGARETTE)"
@@ -419,6 +668,122 @@ class SmokingVapingDetector:
             print(f"Error saving result: {e}")
             return False
 
+class DetectionStore:
+    """Per-detection rows of a batch run in SQLite, inserted in buffered batches"""
+    
+    def __init__(self, db_path, flush_every=DB_FLUSH_IMAGES):
+        self.conn = sqlite3.connect(db_path)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        with self.conn:
+            self.conn.execute(
+                "CREATE TABLE IF NOT EXISTS detections ("
+                "image_path TEXT, class TEXT, confidence REAL, "
+                "x INTEGER, y INTEGER, w INTEGER, h INTEGER, is_cig INTEGER)"
+            )
+            # Each run replaces the previous one, like batch_results.ndjson
+            self.conn.execute("DELETE FROM detections")
+        self.flush_every = flush_every
+        self._rows = []
+        self._pending_images = 0
+    
+    def add(self, result):
+        image_path = result["image_path"]
+        self._rows.extend(
+            (image_path, d["class"], d["confidence"], *d["bbox"], int(d["is_cigarette_related"]))
+            for d in result["detections"]
+        )
+        self._pending_images += 1
+        if self._pending_images >= self.flush_every:
+            self.flush()
+    
+    def flush(self):
+        if self._rows:
+            with self.conn:
+                self.conn.executemany(
+                    "INSERT INTO detections (image_path, class, confidence, x, y, w, h, is_cig) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                    self._rows,
+                )
+            self._rows.clear()
+        self._pending_images = 0
+    
+    def close(self):
+        self.flush()
+        self.conn.close()
+
+def _json_default(obj):
+    """stdlib json fallback for NumPy scalars and arrays"""
+    if isinstance(obj, (np.generic, np.ndarray)):
+        return obj.tolist()
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+def _dumps(obj, indent=False):
+    """Encode to JSON bytes with orjson when available; NumPy values are serialized natively"""
+    if orjson is not None:
+        option = orjson.OPT_SERIALIZE_NUMPY
+        if indent:
+            option |= orjson.OPT_INDENT_2
+        return orjson.dumps(obj, option=option)
+    return json.dumps(obj, indent=2 if indent else None, default=_json_default).encode()
+
+def _json_line(obj):
+    """Encode one NDJSON record, leaving out private keys such as _image"""
+    obj = {key: value for key, value in obj.items() if not key.startswith("_")}
+    return _dumps(obj) + b"\n"
+
+def analyze_paths(detector, paths, confidence_threshold, batch_size, depth=PIPELINE_DEPTH):
+    """Yield (path, result, error) for each path, running inference batch_size images at a time.
+    
+    Decoding, inference and postprocessing are pipelined: loader threads
+    decode up to depth batches ahead and a postprocess thread finishes
+    earlier batches while the network runs the current one on this thread.
+    On CPU, decoding uses half the cores (cv2.imread releases the GIL) to
+    keep up with the network; on GPU one loader is enough.
+    """
+    if detector.net is None:
+        for path in paths:
+            yield path, None, "Model not loaded"
+        return
+    
+    loaders = 1 if detector.use_gpu else max(1, (os.cpu_count() or 2) // 2)
+    depth = max(depth, loaders)
+    
+    chunks = (paths[start:start + batch_size] for start in range(0, len(paths), batch_size))
+    loading = deque()
+    finishing = deque()
+    
+    def emit(chunk, future):
+        for path, (result, error) in zip(chunk, future.result()):
+            yield path, result, error
+    
+    with ThreadPoolExecutor(max_workers=loaders, thread_name_prefix="decode") as loader, \
+            ThreadPoolExecutor(max_workers=1, thread_name_prefix="postprocess") as finisher:
+        
+        def fill():
+            while len(loading) < depth:
+                chunk = next(chunks, None)
+                if chunk is None:
+                    return
+                loading.append((chunk, loader.submit(detector._load_batch, chunk)))
+        
+        fill()
+        while loading:
+            chunk, future = loading.popleft()
+            fill()
+            loaded = future.result()
+            inferred = detector._infer_batch(loaded[1])
+            finishing.append((chunk, finisher.submit(
+                detector._finish_batch, chunk, loaded, inferred, confidence_threshold
+            )))
+            
+            # Hand back finished batches in order without stalling inference
+            while finishing and (len(finishing) > depth or finishing[0][1].done()):
+                yield from emit(*finishing.popleft())
+        
+        while finishing:
+            yield from emit(*finishing.popleft())
+
 def main():
     """Main CLI interface"""
     parser = argparse.ArgumentParser(description="Smoking & Vaping Detection System")
@@ -428,16 +793,37 @@ def main():
     parser.add_argument("--confidence", "-c", type=float, default=0.5, help="Confidence threshold (0-1)")
     parser.add_argument("--output", "-o", help="Output directory for results")
     parser.add_argument("--limit", "-l", type=int, default=100, help="Limit number of photos to analyze")
+    device = parser.add_mutually_exclusive_group()
+    device.add_argument("--gpu", action="store_true", help="Require a CUDA GPU (warns and falls back to CPU if none)")
+    device.add_argument("--cpu", action="store_true", help="Run on CPU even if a CUDA GPU is available")
+    parser.add_argument("--fp16", action="store_true", help="Use half precision on the GPU")
+    parser.add_argument("--gesture-heuristic", action="store_true", help="Run the edge-based smoking/vaping gesture check on people")
+    parser.add_argument("--model", choices=sorted(MODEL_FILES), default="full", help="YOLOv4 variant (tiny is faster on CPU)")
+    parser.add_argument("--threads", type=int, help="OpenCV CPU threads (default: OMP_NUM_THREADS, else half the logical cores)")
+    parser.add_argument("--batch-size", type=int, default=8, help="Images per forward pass for --batch/--apple-photos")
     
     args = parser.parse_args()
+    if args.batch_size < 1:
+        parser.error("--batch-size must be at least 1")
+    
+    # OpenCV's default uses every logical core, which oversubscribes SMT
+    # siblings on the CPU forward pass; roughly one thread per physical core
+    # is usually faster. OMP_NUM_THREADS is honoured when already exported.
+    omp_threads = os.environ.get("OMP_NUM_THREADS", "").strip()
+    omp_threads = int(omp_threads) if omp_threads.isdigit() else 0
+    threads = args.threads or omp_threads or max(1, (os.cpu_count() or 2) // 2)
+    cv2.setNumThreads(threads)
     
     # Initialize detector
-    detector = SmokingVapingDetector()
+    detector = SmokingVapingDetector(
+        use_gpu=True if args.gpu else False if args.cpu else "auto", precision="fp16" if args.fp16 else "fp32",
+        model=args.model, use_gesture_heuristic=args.gesture_heuristic,
+    )
     
     if args.image:
         # Single image analysis
         print(f"Analyzing image: {args.image}")
-        result, error = detector.analyze_image(args.image, args.confidence)
+        result, error = detector.analyze_image(args.image, args.confidence, keep_image=bool(args.output))
         
         if error:
             print(f"Error: {error}")
@@ -474,12 +860,10 @@ def main():
         # Batch analysis
         print(f"Analyzing images in directory: {args.batch}")
         
-        image_extensions = ['.jpg', '.jpeg', '.png', '.bmp', '.tiff']
-        images = []
-        
-        for file in os.listdir(args.batch):
-            if any(file.lower().endswith(ext) for ext in image_extensions):
-                images.append(os.path.join(args.batch, file))
+        images = [
+            os.path.join(args.batch, file) for file in os.listdir(args.batch)
+            if os.path.splitext(file)[1].lower() in IMAGE_EXTENSIONS
+        ]
         
         if not images:
             print("No images found in directory")
@@ -487,49 +871,68 @@ def main():
         
         print(f"Found {len(images)} images")
         
-        results = []
+        processed = 0
         cigarette_count = 0
         
-        for i, image_path in enumerate(images):
-            print(f"Processing {i+1}/{len(images)}: {os.path.basename(image_path)}")
-            
-            result, error = detector.analyze_image(image_path, args.confidence)
-            
-            if error:
-                print(f"  Error: {error}")
-                continue
-            
-            results.append(result)
-            
-            if result['cigarette_detected']:
-                cigarette_count += 1
-                print(f"  ✓ Cigarette detected (confidence: {result['max_confidence']:.2f})")
-            else:
-                print(f"  ✗ No cigarette detected")
+        # Results are streamed one JSON line per image instead of kept in memory
+        # and per-detection rows go to a SQLite database in buffered inserts
+        results_file = None
+        store = None
+        if args.output:
+            os.makedirs(args.output, exist_ok=True)
+            results_path = os.path.join(args.output, "batch_results.ndjson")
+            db_path = os.path.join(args.output, "results.db")
+            results_file = open(results_path, 'wb')
+            store = DetectionStore(db_path)
+        
+        try:
+            batches = analyze_paths(detector, images, args.confidence, args.batch_size)
+            for i, (image_path, result, error) in enumerate(batches):
+                print(f"Processing {i+1}/{len(images)}: {os.path.basename(image_path)}")
+                
+                if error:
+                    print(f"  Error: {error}")
+                    continue
+                
+                processed += 1
+                if results_file is not None:
+                    results_file.write(_json_line(result))
+                    store.add(result)
+                
+                if result['cigarette_detected']:
+                    cigarette_count += 1
+                    print(f"  ✓ Cigarette detected (confidence: {result['max_confidence']:.2f})")
+                else:
+                    print(f"  ✗ No cigarette detected")
+        finally:
+            if results_file is not None:
+                results_file.close()
+                store.close()
+        
+        detection_rate = cigarette_count / processed * 100 if processed else 0
         
         # Summary
         print(f"\nBatch Analysis Summary:")
-        print(f"Total images processed: {len(results)}")
+        print(f"Total images processed: {processed}")
         print(f"Images with cigarettes: {cigarette_count}")
-        print(f"Detection rate: {cigarette_count/len(results)*100:.1f}%")
+        print(f"Detection rate: {detection_rate:.1f}%")
         
         # Save results
         if args.output:
-            os.makedirs(args.output, exist_ok=True)
-            
-            # Save JSON summary
             summary = {
-                "total_images": len(results),
+                "total_images": processed,
                 "cigarette_detections": cigarette_count,
-                "detection_rate": cigarette_count/len(results)*100 if results else 0,
-                "results": results
+                "detection_rate": detection_rate,
+                "results_file": os.path.basename(results_path),
             }
             
-            summary_path = os.path.join(args.output, "batch_results.json")
-            with open(summary_path, 'w') as f:
-                json.dump(summary, f, indent=2)
+            summary_path = os.path.join(args.output, "batch_summary.json")
+            with open(summary_path, 'wb') as f:
+                f.write(_dumps(summary, indent=True))
             
-            print(f"Results saved to: {summary_path}")
+            print(f"Results saved to: {results_path}")
+            print(f"Detections database: {db_path}")
+            print(f"Summary saved to: {summary_path}")
     
     elif args.apple_photos:
         # Apple Photos analysis
@@ -543,19 +946,18 @@ def main():
         
         print(f"Found {len(photos)} photos")
         
-        results = []
+        processed = 0
         cigarette_count = 0
         
-        for i, photo_path in enumerate(photos):
+        batches = analyze_paths(detector, photos, args.confidence, args.batch_size)
+        for i, (photo_path, result, error) in enumerate(batches):
             print(f"Processing {i+1}/{len(photos)}: {os.path.basename(photo_path)}")
             
-            result, error = detector.analyze_image(photo_path, args.confidence)
-            
             if error:
                 print(f"  Error: {error}")
                 continue
             
-            results.append(result)
+            processed += 1
             
             if result['cigarette_detected']:
                 cigarette_count += 1
@@ -563,9 +965,9 @@ def main():
         
         # Summary
         print(f"\nApple Photos Analysis Summary:")
-        print(f"Total photos processed: {len(results)}")
+        print(f"Total photos processed: {processed}")
         print(f"Photos with cigarettes: {cigarette_count}")
-        print(f"Detection rate: {cigarette_count/len(results)*100:.1f}%")
+        print(f"Detection rate: {cigarette_count / processed * 100 if processed else 0:.1f}%")
     
     else:
         parser.print_help()
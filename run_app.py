@@ -11,7 +11,15 @@ from api_server import app
 def _start_api_server() -> None:
     """Start FastAPI server (runs in background thread)."""
     # Disable HTTP access logs to avoid noisy per-request INFO lines in the desktop app
-    config = uvicorn.Config(app, host="127.0.0.1", port=8000, log_level="info", access_log=False)
+    config = uvicorn.Config(
+        app,
+        host="127.0.0.1",
+        port=8000,
+        log_level="info",
+        access_log=False,
+        ws_ping_interval=20,
+        ws_ping_timeout=20,
+    )
     server = uvicorn.Server(config)
     server.run()
 
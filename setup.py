@@ -12,6 +12,9 @@ OPTIONS = {
         "fastapi",
         "uvicorn",
         "starlette",
+        "aiofiles",
+        "orjson",
+        "msgpack",
         "anyio",
         "sniffio",
         "PIL",
@@ -5,6 +5,7 @@ Downloads YOLOv4 model files and COCO class names
 """
 
 import os
+import argparse
 import urllib.request
 import sys
 from pathlib import Path
@@ -29,6 +30,10 @@ def download_file(url, filename, description=""):
 
 def main():
     """Main setup function"""
+    parser = argparse.ArgumentParser(description="Download detection model files")
+    parser.add_argument("--tiny", action="store_true", help="Also download YOLOv4-tiny (for main.py --model tiny)")
+    args = parser.parse_args()
+    
     print("Cigarette Detection System - Model Setup")
     print("=" * 50)
     
@@ -55,6 +60,20 @@ def main():
         }
     ]
     
+    if args.tiny:
+        files_to_download += [
+            {
+                "url": "https://raw.githubusercontent.com/AlexeyAB/darknet/master/cfg/yolov4-tiny.cfg",
+                "filename": models_dir / "yolov4-tiny.cfg",
+                "description": "YOLOv4-tiny Configuration"
+            },
+            {
+                "url": "https://github.com/AlexeyAB/darknet/releases/download/darknet_yolo_v4_pre/yolov4-tiny.weights",
+                "filename": models_dir / "yolov4-tiny.weights",
+                "description": "YOLOv4-tiny Weights (23MB)"
+            }
+        ]
+    
     success_count = 0
     
     for file_info in files_to_download: